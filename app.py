@@ -1,10 +1,25 @@
-from flask import Flask, render_template, redirect, url_for, request, jsonify, session
+from flask import Flask, render_template, redirect, url_for, request, jsonify, session, make_response, Response
 from modules.ha_client import HomeAssistantClient
+from modules.event_loop import BackgroundLoop
+from modules.websocket import WebSocketServer
+from modules.coalescer import CommandCoalescer
+from modules.config_cache import ConfigurationCache, snapshot_configuration
+from modules import sqlite_profile
+from modules.layout_version import LayoutVersion
+from modules.room_snapshots import RoomSnapshots
+from modules.layout_io import export_layout, import_layout
+from modules.stale_cache import StaleWhileRevalidateCache
+from modules.http_client import HttpClient
+from modules.media_cache import MediaCache, make_entry, media_etag, is_fresh
+from modules.media_transform import TransformPool, parse_transform, transform_key, transform_image
 from modules.models import db, Configuration, Room, Entity, entity_rooms
 import json
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlencode
 import logging
-import asyncio
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import time
 import qrcode
 import base64
 from io import BytesIO
@@ -12,7 +27,14 @@ import requests
 from datetime import datetime
 import os
 from dotenv import load_dotenv
-from flask_migrate import Migrate
+from flask_migrate import Migrate, upgrade as upgrade_db, stamp as stamp_db
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.orm import joinedload
+from werkzeug.datastructures import ResponseCacheControl
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import parse_cache_control_header, unquote_etag
+from werkzeug.wsgi import wrap_file
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
 
@@ -20,13 +42,159 @@ load_dotenv()  # This loads the .env file
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
-db.init_app(app)
-migrate = Migrate(app, db)
+sqlite_profile.init_app(app, db)
+migrate = Migrate(app, db, directory=os.path.join(app.root_path, 'migrations'), render_as_batch=True)
 
-ha_client = None  # Only used for setup/configuration now
+# Revision stamped in the shipped instance/smart_home.db, from a migrations
+# history that was never committed. Its schema is what db.create_all()
+# builds, so it is safe to upgrade from base
+LEGACY_ALEMBIC_REVISION = '3b05fabd5701'
+
+def upgrade_database():
+    """Apply pending migrations to the database, whatever created it.
+
+    A database stamped with LEGACY_ALEMBIC_REVISION is re-stamped to base
+    first, since alembic refuses to upgrade from a revision it can't find.
+    Any other unknown revision most likely means the database was migrated
+    by a newer checkout, so it is left alone and an error is raised.
+    """
+    script = ScriptDirectory.from_config(migrate.get_config())
+    known = {revision.revision for revision in script.walk_revisions()}
+    with db.engine.connect() as connection:
+        current = MigrationContext.configure(connection).get_current_heads()
+    unknown = [revision for revision in current if revision not in known]
+    if unknown == [LEGACY_ALEMBIC_REVISION]:
+        logger.warning(f"Database is stamped with legacy revision {LEGACY_ALEMBIC_REVISION}; re-stamping from base")
+        stamp_db(revision='base', purge=True)
+    elif unknown:
+        raise Exception(f"Database is at migration revision {', '.join(unknown)}, which this checkout "
+                        f"doesn't have (was it upgraded by a newer version?). Update the code or restore a backup.")
+    upgrade_db()
+
+ha_client = None  # Shared, long-lived Home Assistant connection
+# Guards creating and swapping ha_client, so concurrent requests (and the
+# relay) never build two clients for the same configuration
+ha_client_lock = threading.Lock()
 spotify_client = None
 logger = logging.getLogger(__name__)
 
+# One long-running loop owns the HA connection, its state cache and
+# subscriptions; request handlers submit coroutines to it
+ha_loop = BackgroundLoop(name='ha-loop', default_timeout=app.config['HA_REQUEST_TIMEOUT']).start()
+
+# All outbound HTTP goes through pooled per-host sessions with timeouts
+http_client = HttpClient(
+    connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+    read_timeout=app.config['HTTP_READ_TIMEOUT'],
+    retries=app.config['HTTP_RETRIES'],
+    backoff=app.config['HTTP_RETRY_BACKOFF'],
+    pool_size=app.config['HTTP_POOL_SIZE']
+)
+
+# Album art and other proxied images, shared by every tablet
+media_cache = MediaCache(
+    directory=app.config['MEDIA_CACHE_DIR'] or os.path.join(app.instance_path, 'media_cache'),
+    memory_bytes=app.config['MEDIA_CACHE_MEMORY_BYTES'],
+    disk_bytes=app.config['MEDIA_CACHE_DISK_BYTES'],
+    max_entry_bytes=app.config['MEDIA_CACHE_MAX_ENTRY_BYTES']
+)
+
+# Resizing and re-encoding for ?w=&h=&format= runs here, off request threads
+media_transforms = TransformPool(workers=app.config['MEDIA_TRANSFORM_WORKERS'])
+
+# Slider drags fire many position commands a second; only the latest one
+# per entity and window is sent on to Home Assistant
+command_coalescer = CommandCoalescer(window=app.config['COMMAND_COALESCE_WINDOW'])
+
+def load_configuration():
+    return snapshot_configuration(Configuration.query.first())
+
+# Every request needs the configuration (check_setup alone reads it on each
+# one), so it is held in memory and invalidated whenever it is written
+configuration_cache = ConfigurationCache(load_configuration)
+
+# Bumped by every route that changes rooms, entities or their order; the
+# layout endpoints use it as their ETag
+layout_version = LayoutVersion()
+
+def layout_response(build):
+    """Return build()'s response tagged with the layout ETag, or 304 if the client has it"""
+    etag = layout_version.etag()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    # Let browsers keep the body but always check the tag before using it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Runs the independent sections of /api/dashboard/bootstrap side by side
+bootstrap_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix='bootstrap')
+
+def get_configuration():
+    """The stored configuration, or None if Home Assistant isn't set up yet"""
+    return configuration_cache.get()
+
+def run_on_ha_loop(coro, timeout=None):
+    """Run a coroutine on the shared HA loop and wait for its result"""
+    return ha_loop.run(coro, timeout=timeout)
+
+@atexit.register
+def shutdown_ha_loop():
+    if ha_client and ha_client.is_connected:
+        try:
+            run_on_ha_loop(ha_client.close(), timeout=5)
+        except Exception as e:
+            logger.error(f"Error closing Home Assistant connection: {str(e)}")
+    ha_loop.stop()
+
+def get_ha_client(config):
+    """Return the shared HA client, replacing it if the configuration changed"""
+    ws_url = f"{config.ws_url}/api/websocket"
+    with ha_client_lock:
+        replaced = (not ha_client or ha_client.ws_url != ws_url or
+                    ha_client.access_token != config.access_token)
+        if replaced:
+            _swap_ha_client(HomeAssistantClient(
+                ws_url=config.ws_url,
+                access_token=config.access_token,
+                is_nabu_casa=config.is_nabu_casa
+            ))
+        client = ha_client
+    if replaced:
+        # Open dashboards follow the new client instead of the closed one
+        websocket_server.wake_upstream()
+    return client
+
+def set_ha_client(client):
+    """Swap in a new shared HA client and close the previous connection"""
+    with ha_client_lock:
+        _swap_ha_client(client)
+    # Open dashboards follow the new client instead of the closed one
+    websocket_server.wake_upstream()
+
+def _swap_ha_client(client):
+    # Called with ha_client_lock held
+    global ha_client
+    previous, ha_client = ha_client, client
+    if previous:
+        ha_loop.submit(previous.close())
+
+def current_ha_client():
+    """The shared HA client for the stored configuration, if there is one"""
+    config = get_configuration()
+    return get_ha_client(config) if config else None
+
+def tracked_entity_ids():
+    return [entity_id for (entity_id,) in db.session.query(Entity.entity_id)]
+
+# Dashboards get state updates and send commands through this relay, so
+# Home Assistant only ever sees the backend's single connection
+websocket_server = WebSocketServer(app, ha_loop, current_ha_client, tracked_entity_ids)
+
 def initialize_spotify_client():
     """Initialize the Spotify client if credentials are configured"""
     global spotify_client
@@ -79,13 +247,13 @@ def check_setup():
         return
     
     # Check if setup is complete
-    config = Configuration.query.first()
+    config = get_configuration()
     if not config or not config.is_configured:
         return redirect(url_for('setup'))
 
 @app.route("/")
 def dashboard():
-    config = Configuration.query.first()
+    config = get_configuration()
     if not config or not config.is_configured:
         return redirect(url_for('setup'))
         
@@ -93,7 +261,7 @@ def dashboard():
 
 @app.route("/setup", methods=['GET'])
 def setup():
-    config = Configuration.query.first()
+    config = get_configuration()
     step = request.args.get('step', '1')
     
     # Get HA config if it exists
@@ -146,14 +314,14 @@ def setup_ha():
     )
     db.session.add(config)
     db.session.commit()
+    configuration_cache.invalidate()
     
     # Initialize global HA client with new configuration
-    global ha_client
-    ha_client = HomeAssistantClient(
+    set_ha_client(HomeAssistantClient(
         ws_url=ws_url,
         access_token=data['access_token'].strip(),
         is_nabu_casa=is_nabu_casa
-    )
+    ))
     
     return jsonify({'success': True})
 
@@ -163,6 +331,7 @@ def delete_room(room_id):
         room = Room.query.get_or_404(room_id)
         db.session.delete(room)
         db.session.commit()
+        layout_version.bump()
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -183,57 +352,63 @@ def setup_rooms():
             db.session.add(room)
     
     db.session.commit()
+    layout_version.bump()
     return jsonify({'success': True})
 
 @app.route("/api/rooms/reorder", methods=['POST'])
 def reorder_rooms():
     try:
-        data = request.json
-        room_orders = data.get('roomOrders', [])
+        data = request.get_json(silent=True) or {}
+        pairs = data.get('roomOrders', [])
+        if not isinstance(pairs, list):
+            return jsonify({'error': 'roomOrders must be a list of [room id, order] pairs'}), 400
         
-        for room_id, new_order in room_orders:
-            room = Room.query.get(room_id)
-            if room:
-                room.order = new_order
+        room_orders = {}
+        for index, pair in enumerate(pairs):
+            try:
+                room_id, new_order = pair
+                # The settings page sends room ids as strings
+                room_orders[int(room_id)] = int(new_order)
+            except (TypeError, ValueError):
+                return jsonify({'error': f'roomOrders entry {index} must be a [room id, order] pair of numbers'}), 400
+        
+        # One UPDATE ... SET order = CASE id WHEN ... for the whole list
+        if room_orders:
+            db.session.execute(
+                db.update(Room)
+                .where(Room.id.in_(list(room_orders)))
+                .values(order=db.case(room_orders, value=Room.id))
+                .execution_options(synchronize_session=False)
+            )
         
         db.session.commit()
+        layout_version.bump()
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route("/api/rooms")
-def get_rooms():
+def rooms_payload():
     rooms = Room.query.order_by(Room.order).all()
-    return jsonify([{
+    return [{
         'id': room.id,
         'name': room.name,
         'order': room.order
-    } for room in rooms])
+    } for room in rooms]
+
+@app.route("/api/rooms")
+def get_rooms():
+    return layout_response(lambda: jsonify(rooms_payload()))
 
 @app.route("/api/ha/entities")
 def get_ha_entities():
     try:
-        config = Configuration.query.first()
+        config = get_configuration()
         if not config:
             return jsonify({'error': 'Home Assistant not configured'}), 400
         
-        global ha_client
-        if not ha_client or not ha_client.connection:
-            ha_client = HomeAssistantClient(
-                ws_url=config.ws_url,
-                access_token=config.access_token,
-                is_nabu_casa=config.is_nabu_casa
-            )
-        
-        async def get_entities_async():
-            try:
-                await ha_client.connect()
-                return await ha_client.get_entities()
-            finally:
-                await ha_client.disconnect()  # Ensure we disconnect properly
-        
-        entities = asyncio.run(get_entities_async())  # Use asyncio.run instead
+        client = get_ha_client(config)
+        entities = run_on_ha_loop(client.get_entities())
         return jsonify(entities)
         
     except Exception as e:
@@ -244,27 +419,47 @@ def get_ha_entities():
 def setup_entities():
     data = request.json
     try:
-        # Clear existing entities and relationships
-        Entity.query.delete()
-        db.session.execute(db.text('DELETE FROM entity_rooms'))
-        db.session.commit()
+        # Rooms are loaded once instead of once per entity per room
+        room_ids = {room_id for (room_id,) in db.session.query(Room.id)}
         
-        # Add new entities and their room relationships
+        # Merge duplicate entity ids so each entity is inserted once
+        entities = {}
         for entity_data in data['entities']:
-            entity = Entity(
-                entity_id=entity_data['entity_id'],
-                name=entity_data['name'],
-                domain=entity_data['domain']
-            )
-            db.session.add(entity)
+            entity = entities.setdefault(entity_data['entity_id'], {
+                'entity_id': entity_data['entity_id'],
+                'name': entity_data['name'],
+                'domain': entity_data['domain'],
+                'rooms': []
+            })
+            entity['rooms'].extend(room_id for room_id in entity_data['rooms']
+                                   if room_id in room_ids and room_id not in entity['rooms'])
+        
+        # Clear existing entities and relationships; everything below runs
+        # in this one transaction
+        Entity.query.delete()
+        db.session.execute(db.delete(entity_rooms))
+        
+        if entities:
+            db.session.execute(db.insert(Entity), [
+                {'entity_id': e['entity_id'], 'name': e['name'], 'domain': e['domain']}
+                for e in entities.values()
+            ])
+            ids = dict(db.session.query(Entity.entity_id, Entity.id))
             
-            # Add entity to specified rooms
-            for room_id in entity_data['rooms']:
-                room = Room.query.get(room_id)
-                if room:
-                    entity.rooms.append(room)
+            # Each room keeps the order its entities were submitted in
+            room_positions = {}
+            links = []
+            for entity in entities.values():
+                for room_id in entity['rooms']:
+                    position = room_positions.get(room_id, 0)
+                    room_positions[room_id] = position + 1
+                    links.append({'entity_id': ids[entity['entity_id']], 'room_id': room_id, 'order': position})
+            if links:
+                db.session.execute(db.insert(entity_rooms), links)
         
         db.session.commit()
+        layout_version.bump()
+        websocket_server.refresh_tracked_entities()
         return jsonify({'success': True})
             
     except Exception as e:
@@ -272,6 +467,41 @@ def setup_entities():
         logger.error(f"Error in setup_entities: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route("/api/setup/layout", methods=['GET'])
+def export_layout_file():
+    """Download rooms, entities and their order as one compact JSON file"""
+    try:
+        body = json.dumps(export_layout(), separators=(',', ':'))
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['Content-Disposition'] = 'attachment; filename=friday-layout.json'
+        return response
+    except Exception as e:
+        logger.error(f"Error exporting layout: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route("/api/setup/layout", methods=['POST'])
+def import_layout_file():
+    """Replace the layout with an exported one, in a single transaction
+
+    Accepts the file as a JSON body or as a 'layout' form upload. Only rows
+    that differ are written; unchanged entities keep their ids.
+    """
+    try:
+        upload = request.files.get('layout')
+        layout = json.load(upload) if upload else request.get_json(force=True)
+        changes = import_layout(layout)
+        db.session.commit()
+        layout_version.bump()
+        websocket_server.refresh_tracked_entities()
+        return jsonify({'success': True, 'changes': changes})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing layout: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route("/api/setup/test-ha", methods=['POST'])
 def test_ha_connection():
     try:
@@ -308,7 +538,7 @@ def test_ha_connection():
         )
         
         # Test the connection
-        success, error_message = test_client.test_connection()
+        success, error_message = run_on_ha_loop(test_client.test_connection())
         
         if success:
             # Store the successful connection details in the session
@@ -333,22 +563,39 @@ def test_ha_connection():
             'error': error_message
         }), 400
 
+def fetch_weather_forecast(location):
+    """Fetch the 3-day forecast for a location from weatherapi.com; raises if it can't"""
+    api_key = os.getenv('WEATHER_API_KEY')
+    
+    if not api_key:
+        raise Exception('Weather API key not configured. Please set WEATHER_API_KEY in your environment variables.')
+    
+    # Add aqi=yes to get air quality data
+    url = f"http://api.weatherapi.com/v1/forecast.json?key={api_key}&q={location}&days=3&aqi=yes"
+    response = http_client.get(url)
+    response.raise_for_status()
+    return response.json()
+
+# Every tablet polls the forecast, so they share one upstream call per TTL,
+# and page loads get the cached copy while it is refreshed in the background
+weather_cache = StaleWhileRevalidateCache(
+    fetch_weather_forecast,
+    ttl=app.config['WEATHER_CACHE_TTL'],
+    max_stale=app.config['WEATHER_CACHE_MAX_STALE'],
+    name='weather'
+)
+
+def get_weather():
+    """The forecast for LOCATION and how it was served (fresh, stale, miss or fallback)"""
+    return weather_cache.lookup(os.getenv('LOCATION', 'London'))
+
 @app.route("/api/weather/forecast")
 def get_weather_forecast():
     try:
-        api_key = os.getenv('WEATHER_API_KEY')
-        location = os.getenv('LOCATION', 'London')
-        
-        if not api_key:
-            return jsonify({'error': 'Weather API key not configured. Please set WEATHER_API_KEY in your environment variables.'}), 500
-        
-        # Add aqi=yes to get air quality data
-        url = f"http://api.weatherapi.com/v1/forecast.json?key={api_key}&q={location}&days=3&aqi=yes"
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        forecast_data = response.json()
-        return jsonify(forecast_data)
+        forecast_data, cache_state = get_weather()
+        response = jsonify(forecast_data)
+        response.headers['X-Cache'] = cache_state
+        return response
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 403:
             return jsonify({'error': 'Invalid or missing API key. Please check your WEATHER_API_KEY environment variable.'}), 403
@@ -356,71 +603,89 @@ def get_weather_forecast():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def build_room_layouts():
+    """Devices of every room in display order, keyed by room id"""
+    layouts = {room_id: [] for (room_id,) in db.session.query(Room.id)}
+    
+    # Get entities with their order from the junction table, for all rooms at once
+    rows = db.session.query(
+        entity_rooms.c.room_id,
+        Entity.entity_id,
+        Entity.name,
+        Entity.domain,
+        entity_rooms.c.order
+    ).join(
+        Entity, Entity.id == entity_rooms.c.entity_id
+    ).order_by(
+        entity_rooms.c.room_id,
+        entity_rooms.c.order
+    )
+    
+    # Format devices for frontend
+    for room_id, entity_id, name, domain, order in rows:
+        if room_id in layouts:
+            layouts[room_id].append({
+                'id': entity_id,
+                'name': name,
+                'type': domain,
+                'order': order or 0  # Use 0 as default if order is None
+            })
+    return layouts
+
+# Room device lists are served from memory and rebuilt after layout writes
+room_snapshots = RoomSnapshots(layout_version, build_room_layouts)
+
+def room_devices_payload(room_id):
+    devices = room_snapshots.devices(room_id)
+    if devices is None:
+        raise Exception(f"Room {room_id} not found")
+    return devices
+
 @app.route("/api/rooms/<int:room_id>/devices")
 def get_room_devices(room_id):
-    try:
-        room = Room.query.get_or_404(room_id)
-        
-        # Get entities with their order from the junction table
-        entities_with_order = db.session.query(
-            Entity, 
-            entity_rooms.c.order
-        ).join(
-            entity_rooms
-        ).filter(
-            entity_rooms.c.room_id == room_id
-        ).order_by(
-            entity_rooms.c.order
-        ).all()
-        
-        # Format devices for frontend
-        devices = []
-        for entity, order in entities_with_order:
-            device = {
-                'id': entity.entity_id,
-                'name': entity.name,
-                'type': entity.domain,
-                'order': order or 0  # Use 0 as default if order is None
-            }
-            devices.append(device)
-        
-        return jsonify(devices)
-        
-    except Exception as e:
-        logger.error(f"Error getting room devices: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+    def build():
+        try:
+            body = room_snapshots.encoded(room_id)
+            if body is None:
+                return jsonify({'error': 'Room not found'}), 404
+            return app.response_class(body, mimetype='application/json')
+        except Exception as e:
+            logger.error(f"Error getting room devices: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    
+    return layout_response(build)
+
+def tracked_entities_payload():
+    # Get all entities from database, with their rooms joined into the same query
+    entities = Entity.query.options(joinedload(Entity.rooms)).all()
+
+    # Format response with rooms
+    return [{
+        'entity_id': entity.entity_id,
+        'name': entity.name,
+        'domain': entity.domain,
+        'rooms': [{'id': room.id, 'name': room.name} for room in entity.rooms]
+    } for entity in entities]
 
 @app.route("/api/entities/tracked")
 def get_tracked_entities():
-    try:
-        # Get all entities from database
-        entities = Entity.query.all()
-        
-        # Format response with rooms
-        tracked_entities = [{
-            'entity_id': entity.entity_id,
-            'name': entity.name,
-            'domain': entity.domain,
-            'rooms': [{'id': room.id, 'name': room.name} for room in entity.rooms]
-        } for entity in entities]
-        
-        # Get HA connection details for WebSocket
-        config = Configuration.query.first()
-        if not config:
-            return jsonify({'error': 'Home Assistant not configured'}), 400
+    config = get_configuration()
+    if not config:
+        return jsonify({'error': 'Home Assistant not configured'}), 400
+
+    def build():
+        try:
+            # Live state comes from the Socket.IO relay, so the browser no longer
+            # needs the HA URL or access token
+            return jsonify({
+                'entities': tracked_entities_payload()
+            })
             
-        return jsonify({
-            'entities': tracked_entities,
-            'ha_config': {
-                'ws_url': config.ws_url,
-                'access_token': config.access_token,
-                'is_nabu_casa': config.is_nabu_casa
-            }
-        })
-        
-    except Exception as e:
-        logger.error(f"Error getting tracked entities: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        except Exception as e:
+            logger.error(f"Error getting tracked entities: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    
+    return layout_response(build)
 
 @app.route("/settings")
 def settings():
@@ -428,7 +693,7 @@ def settings():
 
 @app.route("/api/settings/ha", methods=['GET'])
 def get_ha_settings():
-    config = Configuration.query.first()
+    config = get_configuration()
     if not config:
         return jsonify({'error': 'No configuration found'}), 404
     
@@ -467,7 +732,7 @@ def update_ha_settings():
             is_nabu_casa=is_nabu_casa
         )
         
-        success, error_message = test_client.test_connection()
+        success, error_message = run_on_ha_loop(test_client.test_connection())
         
         if not success:
             return jsonify({
@@ -497,11 +762,14 @@ def update_ha_settings():
         )
         db.session.add(new_config)
         db.session.commit()
+        configuration_cache.invalidate()
         
         return jsonify({'success': True})
         
     except Exception as e:
         db.session.rollback()
+        # The old row may already be gone if only the second commit failed
+        configuration_cache.invalidate()
         error_message = str(e)
         if "No route to host" in error_message:
             error_message = "Could not reach Home Assistant. Please verify the URL and ensure Home Assistant is running and accessible."
@@ -522,6 +790,7 @@ def remove_device_from_room(room_id, entity_id):
         if room in entity.rooms:
             entity.rooms.remove(room)
             db.session.commit()
+            layout_version.bump()
             
         return jsonify({'success': True})
         
@@ -549,6 +818,8 @@ def add_device_to_room(room_id):
         if room not in entity.rooms:
             entity.rooms.append(room)
             db.session.commit()
+            layout_version.bump()
+            websocket_server.refresh_tracked_entities()
             
         return jsonify({'success': True})
         
@@ -565,74 +836,262 @@ def reorder_room_entities(room_id):
         
         # Get all entities for this room
         room = Room.query.get_or_404(room_id)
+        new_orders = {entity_id: index for index, entity_id in enumerate(entity_ids)}
+        
+        # Resolve every entity and whether it is already linked to the room
+        # in one query
+        resolved = db.session.query(
+            Entity.entity_id,
+            Entity.id,
+            entity_rooms.c.room_id
+        ).outerjoin(
+            entity_rooms,
+            db.and_(entity_rooms.c.entity_id == Entity.id, entity_rooms.c.room_id == room_id)
+        ).filter(
+            Entity.entity_id.in_(list(new_orders))
+        ).all()
+        
+        linked = {entity_pk: new_orders[entity_id]
+                  for entity_id, entity_pk, linked_room in resolved if linked_room is not None}
+        unlinked = [{'room_id': room_id, 'entity_id': entity_pk, 'order': new_orders[entity_id]}
+                    for entity_id, entity_pk, linked_room in resolved if linked_room is None]
         
-        # Update order for each entity in the room
-        for index, entity_id in enumerate(entity_ids):
-            entity = Entity.query.filter_by(entity_id=entity_id).first()
-            if entity:
-                # Check if relationship exists
-                stmt = db.select(entity_rooms).where(
+        # Update existing relationships with a single CASE update
+        if linked:
+            db.session.execute(
+                db.update(entity_rooms).where(
                     entity_rooms.c.room_id == room_id,
-                    entity_rooms.c.entity_id == entity.id
-                )
-                exists = db.session.execute(stmt).first() is not None
-                
-                if exists:
-                    # Update existing relationship
-                    db.session.execute(
-                        db.update(entity_rooms).where(
-                            entity_rooms.c.room_id == room_id,
-                            entity_rooms.c.entity_id == entity.id
-                        ).values(order=index)
-                    )
-                else:
-                    # Create new relationship with order
-                    db.session.execute(
-                        db.insert(entity_rooms).values(
-                            room_id=room_id,
-                            entity_id=entity.id,
-                            order=index
-                        )
-                    )
+                    entity_rooms.c.entity_id.in_(list(linked))
+                ).values(order=db.case(linked, value=entity_rooms.c.entity_id))
+            )
+        
+        # Create missing relationships with order in one executemany
+        if unlinked:
+            db.session.execute(db.insert(entity_rooms), unlinked)
         
         db.session.commit()
+        layout_version.bump()
         return jsonify({'success': True})
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# Query parameters handled by the proxy itself rather than Home Assistant
+MEDIA_TRANSFORM_PARAMS = ('w', 'h', 'format')
+
+def media_cache_key(entity_picture, args):
+    # Home Assistant rotates the access token in entity_picture URLs, so it
+    # is left out of the key; the 'cache' parameter changes with the image
+    params = sorted((name, value) for name, value in args.items(multi=True)
+                    if name != 'token' and name not in MEDIA_TRANSFORM_PARAMS)
+    return entity_picture + ('?' + '&'.join(f'{name}={value}' for name, value in params) if params else '')
+
+def upstream_max_age(response):
+    """Seconds the upstream lets us reuse a response without asking again, or None to not cache it"""
+    cache_control = parse_cache_control_header(response.headers.get('Cache-Control'), cls=ResponseCacheControl)
+    if cache_control.no_store:
+        return None
+    if cache_control.no_cache:
+        return 0
+    if cache_control.max_age is not None:
+        return cache_control.max_age
+    return app.config['MEDIA_CACHE_TTL']
+
+# Upstream bodies are relayed in chunks of this size, so a request holds
+# one chunk in memory however large the image is
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+# Headers copied from Home Assistant onto a streamed image
+STREAMED_MEDIA_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Accept-Ranges', 'Content-Range')
+
+def open_media(config, entity_picture, params, cached=None, range_header=None):
+    """Start streaming an image from Home Assistant, revalidating cached when there is one"""
+    ha_url = config.ha_url.rstrip('/')
+    full_url = f"{ha_url}/{entity_picture}"
+    if params:
+        full_url += '?' + urlencode(params)
+
+    headers = {
+        'Authorization': f'Bearer {config.access_token}',
+        'Accept': 'image/*'
+    }
+    if cached:
+        if cached.upstream_etag:
+            headers['If-None-Match'] = f'"{cached.upstream_etag}"'
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+    elif range_header:
+        # Nothing cached to slice, so Home Assistant serves the range
+        headers['Range'] = range_header
+
+    response = http_client.get(full_url, headers=headers, stream=True)
+    if response.status_code >= 400:
+        response.close()
+        response.raise_for_status()
+    return response
+
+def cached_media_response(key, entry):
+    """Serve a cache entry from memory, or streamed from disk, honouring If-None-Match and Range"""
+    if entry.body is not None:
+        response = Response(entry.body, content_type=entry.content_type)
+    else:
+        response = Response(wrap_file(request.environ, media_cache.open_body(key), MEDIA_CHUNK_SIZE),
+                            content_type=entry.content_type, direct_passthrough=True)
+        response.content_length = entry.size
+
+    # Browsers keep the image for as long as we would, then revalidate
+    # with If-None-Match and get a 304 from the cache
+    response.set_etag(entry.etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = int(entry.max_age)
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=entry.size)
+    except RequestedRangeNotSatisfiable as e:
+        response.close()
+        return e.get_response()
+
+def streamed_media_response(key, upstream):
+    """Relay an upstream image chunk by chunk, copying it into the cache if it may be stored"""
+    max_age = upstream_max_age(upstream)
+    chunks = upstream.iter_content(MEDIA_CHUNK_SIZE)
+    if upstream.status_code == 200 and max_age is not None:
+        upstream_etag = upstream.headers.get('ETag')
+        chunks = media_cache.store_stream(
+            key, chunks, upstream.headers.get('Content-Type'),
+            unquote_etag(upstream_etag)[0] if upstream_etag else None,
+            upstream.headers.get('Last-Modified'), max_age
+        )
+
+    response = Response(chunks, status=upstream.status_code, direct_passthrough=True)
+    for header in STREAMED_MEDIA_HEADERS:
+        if header in upstream.headers:
+            response.headers[header] = upstream.headers[header]
+    # requests decodes a compressed body, so its length no longer matches
+    if 'Content-Length' in upstream.headers and 'Content-Encoding' not in upstream.headers:
+        response.headers['Content-Length'] = upstream.headers['Content-Length']
+    response.cache_control.private = True
+    if max_age is None:
+        response.cache_control.no_store = True
+    else:
+        response.cache_control.max_age = int(max_age)
+    response.call_on_close(upstream.close)
+    return response
+
+def load_media_source(config, entity_picture, params, key):
+    """The original image with its body in memory, and whether it may be stored.
+
+    Comes from the cache when fresh; otherwise it is revalidated or fetched
+    whole, since it has to be decoded anyway.
+    """
+    entry = media_cache.get(key)
+    storable = True
+    if entry is None or not is_fresh(entry):
+        try:
+            upstream = open_media(config, entity_picture, params, entry)
+        except requests.exceptions.RequestException as e:
+            if entry is None:
+                raise
+            logger.error(f"Revalidating {entity_picture} failed, using cached copy: {str(e)}")
+            upstream = None
+
+        if upstream is not None:
+            with upstream:
+                max_age = upstream_max_age(upstream)
+                if entry is not None and upstream.status_code == 304:
+                    entry = media_cache.revalidated(key, entry, max_age or 0)
+                else:
+                    upstream_etag = upstream.headers.get('ETag')
+                    entry = make_entry(upstream.content, upstream.headers.get('Content-Type'),
+                                       unquote_etag(upstream_etag)[0] if upstream_etag else None,
+                                       upstream.headers.get('Last-Modified'), max_age or 0)
+                    storable = max_age is not None
+                    if storable:
+                        media_cache.put(key, entry)
+
+    if entry.body is None:
+        with media_cache.open_body(key) as f:
+            entry = entry._replace(body=f.read())
+    return entry, storable
+
+def build_media_variant(config, entity_picture, params, key, variant_key, transform):
+    """Make a resized or re-encoded variant from the original, or confirm the cached one still matches it"""
+    variant = media_cache.get(variant_key)
+    if variant is not None and is_fresh(variant):
+        # Made by a job that finished just before this one started
+        return variant
+
+    source, storable = load_media_source(config, entity_picture, params, key)
+    if variant is not None and variant.upstream_etag == source.etag:
+        # The original hasn't changed, so neither has the variant
+        return media_cache.revalidated(variant_key, variant, source.max_age)
+
+    try:
+        body, content_type = transform_image(source.body, *transform, app.config['MEDIA_TRANSFORM_QUALITY'])
+    except Exception as e:
+        logger.error(f"Could not transform {entity_picture}, serving the original: {str(e)}")
+        return source
+
+    # upstream_etag records which version of the original it was made from
+    variant = make_entry(body, content_type, upstream_etag=source.etag, max_age=source.max_age,
+                         etag=media_etag(body))
+    if storable:
+        media_cache.put(variant_key, variant)
+    return variant
+
 @app.route("/api/media_proxy/<path:entity_picture>")
 def media_proxy(entity_picture):
     try:
-        config = Configuration.query.first()
+        config = get_configuration()
         if not config:
             return jsonify({'error': 'Home Assistant not configured'}), 400
 
-        # Construct the full URL to the media
-        ha_url = config.ha_url.rstrip('/')
-        full_url = f"{ha_url}/{entity_picture}"
+        try:
+            transform = parse_transform(request.args, app.config['MEDIA_TRANSFORM_MAX_DIMENSION'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Make the request to Home Assistant with the access token
-        headers = {
-            'Authorization': f'Bearer {config.access_token}',
-            'Accept': 'image/*'
-        }
-        
-        response = requests.get(full_url, headers=headers)
-        response.raise_for_status()
+        key = media_cache_key(entity_picture, request.args)
+        params = [(name, value) for name, value in request.args.items(multi=True) if name not in MEDIA_TRANSFORM_PARAMS]
 
-        # Forward the content type header
-        return Response(
-            response.content,
-            content_type=response.headers['content-type'],
-            status=200
-        )
+        if transform:
+            variant_key = f"{key}#{transform_key(*transform)}"
+            variant = media_cache.get(variant_key)
+            if variant is None or not is_fresh(variant):
+                # Fetching the original and transforming it both run on the
+                # pool, shared by concurrent requests for the same variant
+                variant = media_transforms.run(variant_key, build_media_variant,
+                                               config, entity_picture, params, key, variant_key, transform)
+            return cached_media_response(variant_key, variant)
+
+        entry = media_cache.get(key)
+        if entry is not None and is_fresh(entry):
+            return cached_media_response(key, entry)
+
+        try:
+            upstream = open_media(config, entity_picture, params, entry, request.headers.get('Range'))
+        except requests.exceptions.RequestException as e:
+            if entry is None:
+                raise
+            logger.error(f"Revalidating {entity_picture} failed, serving cached copy: {str(e)}")
+            return cached_media_response(key, entry)
+
+        if entry is not None and upstream.status_code == 304:
+            entry = media_cache.revalidated(key, entry, upstream_max_age(upstream) or 0)
+            upstream.close()
+            return cached_media_response(key, entry)
+
+        return streamed_media_response(key, upstream)
 
     except Exception as e:
         logger.error(f"Error proxying media: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stats/media')
+def get_media_stats():
+    """Media proxy cache hits, misses and tier sizes"""
+    return jsonify(media_cache.stats())
+
 @app.route('/api/settings/spotify', methods=['GET', 'POST'])
 def spotify_settings():
     if request.method == 'POST':
@@ -664,13 +1123,12 @@ def spotify_settings():
         'client_secret': os.getenv('SPOTIPY_CLIENT_SECRET', '')
     })
 
-@app.route('/api/spotify/status')
-def spotify_status():
+def spotify_connected():
     client_id = os.getenv('SPOTIPY_CLIENT_ID')
     client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
     
     if not client_id or not client_secret:
-        return jsonify({'connected': False})
+        return False
         
     try:
         auth_manager = SpotifyClientCredentials(
@@ -679,9 +1137,13 @@ def spotify_status():
         )
         sp = spotipy.Spotify(auth_manager=auth_manager)
         sp.search(q='test', limit=1)  # Test the connection
-        return jsonify({'connected': True})
+        return True
     except:
-        return jsonify({'connected': False})
+        return False
+
+@app.route('/api/spotify/status')
+def spotify_status():
+    return jsonify({'connected': spotify_connected()})
 
 def save_spotify_credentials(client_id, client_secret):
     # Read existing .env file
@@ -889,25 +1351,94 @@ def get_spotify_library():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def media_players_payload():
+    # Query for all media_player entities
+    media_players = Entity.query.options(
+        joinedload(Entity.rooms)
+    ).filter_by(domain='media_player').all()
+    
+    # Format the response
+    return [{
+        'entity_id': player.entity_id,
+        'name': player.name,
+        'domain': player.domain,
+        'rooms': [{'id': room.id, 'name': room.name} for room in player.rooms]
+    } for player in media_players]
+
 @app.route('/api/media_players')
 def get_media_players():
     try:
-        # Query for all media_player entities
-        media_players = Entity.query.filter_by(domain='media_player').all()
-        
-        # Format the response
-        players = [{
-            'entity_id': player.entity_id,
-            'name': player.name,
-            'domain': player.domain,
-            'rooms': [{'id': room.id, 'name': room.name} for room in player.rooms]
-        } for player in media_players]
-        
+        players = media_players_payload()
         return jsonify(players)
     except Exception as e:
         logger.error(f"Error getting media players: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def active_room_devices(room_id=None):
+    """Devices of the requested room, or of the first room if none was given"""
+    if room_id is None:
+        room = Room.query.order_by(Room.order).first()
+        if not room:
+            return {'room_id': None, 'devices': []}
+        room_id = room.id
+    return {'room_id': room_id, 'devices': room_devices_payload(room_id)}
+
+def run_bootstrap_section(name, build):
+    """Run one bootstrap section in its own app context, timing it and catching failures"""
+    started = time.perf_counter()
+    try:
+        with app.app_context():
+            return name, build(), None, (time.perf_counter() - started) * 1000
+    except Exception as e:
+        logger.error(f"Error building bootstrap section {name}: {str(e)}")
+        return name, None, str(e), (time.perf_counter() - started) * 1000
+
+@app.route('/api/stats/http')
+def get_http_stats():
+    """Outbound HTTP request counts, latency and pool usage per upstream host"""
+    return jsonify(http_client.stats())
+
+@app.route('/api/dashboard/bootstrap')
+def dashboard_bootstrap():
+    """Everything the dashboard needs for first paint, in one response
+
+    Sections are fetched concurrently, so the slow upstream ones (weather,
+    Spotify) overlap instead of queueing behind each other. A failing
+    section is reported under errors and left null; the rest still load.
+    Sections still running after BOOTSTRAP_TIMEOUT seconds are reported
+    as 'timeout' rather than holding up the response.
+    """
+    room_id = request.args.get('room', type=int)
+    sections = {
+        'tracked': tracked_entities_payload,
+        'rooms': rooms_payload,
+        'devices': lambda: active_room_devices(room_id),
+        'media_players': media_players_payload,
+        'weather': lambda: get_weather()[0],
+        'spotify': lambda: {'connected': spotify_connected()}
+    }
+    
+    started = time.perf_counter()
+    futures = {bootstrap_executor.submit(run_bootstrap_section, name, build): name
+               for name, build in sections.items()}
+    done, pending = wait(futures, timeout=app.config['BOOTSTRAP_TIMEOUT'])
+    
+    payload = {'errors': {}, 'timings': {}}
+    for future in pending:
+        # Left to finish in the background; the dashboard fills it in later
+        name = futures[future]
+        payload[name] = None
+        payload['errors'][name] = 'timeout'
+    for future in done:
+        name, data, error, elapsed_ms = future.result()
+        payload[name] = data
+        payload['timings'][name] = round(elapsed_ms, 1)
+        if error:
+            payload['errors'][name] = error
+    payload['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    
+    return jsonify(payload)
+
 @app.route('/api/spotify/search')
 def spotify_search():
     try:
@@ -932,72 +1463,6 @@ def spotify_search():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-if __name__ == "__main__":
-    # Check each required environment variable individually
-    env_vars = {
-        'WEATHER_API_KEY': {
-            'prompt': "\nYou'll need a Weather API key from weatherapi.com\nEnter your Weather API key: ",
-            'validate': lambda key: requests.get(f"http://api.weatherapi.com/v1/current.json?key={key}&q=London").status_code == 200
-        },
-        'LOCATION': {
-            'prompt': "\nEnter your location (city name or coordinates): ",
-            'validate': lambda x: bool(x.strip())
-        }
-    }
-
-    # Read existing .env file if it exists
-    env_values = {}
-    if os.path.exists('.env'):
-        with open('.env', 'r') as f:
-            for line in f:
-                if '=' in line:
-                    key, value = line.strip().split('=', 1)
-                    env_values[key] = value
-
-    env_updated = False
-    print("\n=== Project Friday Environment Setup ===")
-
-    # Check each variable and prompt if missing or invalid
-    for var_name, config in env_vars.items():
-        current_value = os.getenv(var_name) or env_values.get(var_name)
-        
-        # Skip if value exists and is valid
-        if current_value and config['validate'](current_value):
-            env_values[var_name] = current_value
-            continue
-
-        # Prompt for missing or invalid value
-        while True:
-            value = input(config['prompt']).strip()
-            try:
-                if config['validate'](value):
-                    env_values[var_name] = value
-                    env_updated = True
-                    break
-                print(f"Invalid {var_name}. Please try again.")
-            except:
-                print(f"Error validating {var_name}. Please try again.")
-
-    # Update .env file if changes were made
-    if env_updated:
-        with open('.env', 'w') as f:
-            for key, value in env_values.items():
-                f.write(f'{key}={value}\n')
-        print("\nEnvironment configuration saved successfully!")
-        # Reload environment variables
-        load_dotenv(override=True)
-    
-    
-    # Only setup Spotify if not already configured
-    if not is_spotify_configured():
-        spotify_configured = setup_spotify()
-    
-    # Initialize Spotify client at startup
-    initialize_spotify_client()
-    with app.app_context():
-        db.create_all()
-    app.run(host='0.0.0.0', port=8165, debug=True)
-
 @app.route("/api/services/cover/open_cover", methods=['POST'])
 def open_cover():
     try:
@@ -1007,26 +1472,12 @@ def open_cover():
         if not entity_id:
             return jsonify({'error': 'Missing entity_id parameter'}), 400
         
-        config = Configuration.query.first()
+        config = get_configuration()
         if not config:
             return jsonify({'error': 'Home Assistant not configured'}), 400
         
-        global ha_client
-        if not ha_client or not ha_client.connection:
-            ha_client = HomeAssistantClient(
-                ws_url=config.ws_url,
-                access_token=config.access_token,
-                is_nabu_casa=config.is_nabu_casa
-            )
-        
-        async def call_service_async():
-            try:
-                await ha_client.connect()
-                return await ha_client.call_service("cover", "open_cover", {"entity_id": entity_id})
-            finally:
-                await ha_client.disconnect()  # Ensure we disconnect properly
-        
-        result = asyncio.run(call_service_async())
+        client = get_ha_client(config)
+        result = run_on_ha_loop(client.call_service("cover", "open_cover", {"entity_id": entity_id}))
         return jsonify({'success': True, 'result': result})
         
     except Exception as e:
@@ -1042,26 +1493,12 @@ def close_cover():
         if not entity_id:
             return jsonify({'error': 'Missing entity_id parameter'}), 400
         
-        config = Configuration.query.first()
+        config = get_configuration()
         if not config:
             return jsonify({'error': 'Home Assistant not configured'}), 400
         
-        global ha_client
-        if not ha_client or not ha_client.connection:
-            ha_client = HomeAssistantClient(
-                ws_url=config.ws_url,
-                access_token=config.access_token,
-                is_nabu_casa=config.is_nabu_casa
-            )
-        
-        async def call_service_async():
-            try:
-                await ha_client.connect()
-                return await ha_client.call_service("cover", "close_cover", {"entity_id": entity_id})
-            finally:
-                await ha_client.disconnect()  # Ensure we disconnect properly
-        
-        result = asyncio.run(call_service_async())
+        client = get_ha_client(config)
+        result = run_on_ha_loop(client.call_service("cover", "close_cover", {"entity_id": entity_id}))
         return jsonify({'success': True, 'result': result})
         
     except Exception as e:
@@ -1077,26 +1514,12 @@ def stop_cover():
         if not entity_id:
             return jsonify({'error': 'Missing entity_id parameter'}), 400
         
-        config = Configuration.query.first()
+        config = get_configuration()
         if not config:
             return jsonify({'error': 'Home Assistant not configured'}), 400
         
-        global ha_client
-        if not ha_client or not ha_client.connection:
-            ha_client = HomeAssistantClient(
-                ws_url=config.ws_url,
-                access_token=config.access_token,
-                is_nabu_casa=config.is_nabu_casa
-            )
-        
-        async def call_service_async():
-            try:
-                await ha_client.connect()
-                return await ha_client.call_service("cover", "stop_cover", {"entity_id": entity_id})
-            finally:
-                await ha_client.disconnect()  # Ensure we disconnect properly
-        
-        result = asyncio.run(call_service_async())
+        client = get_ha_client(config)
+        result = run_on_ha_loop(client.call_service("cover", "stop_cover", {"entity_id": entity_id}))
         return jsonify({'success': True, 'result': result})
         
     except Exception as e:
@@ -1116,28 +1539,121 @@ def set_cover_position():
         if position is None:
             return jsonify({'error': 'Missing position parameter'}), 400
         
-        config = Configuration.query.first()
+        config = get_configuration()
         if not config:
             return jsonify({'error': 'Home Assistant not configured'}), 400
         
-        global ha_client
-        if not ha_client or not ha_client.connection:
-            ha_client = HomeAssistantClient(
-                ws_url=config.ws_url,
-                access_token=config.access_token,
-                is_nabu_casa=config.is_nabu_casa
-            )
+        client = get_ha_client(config)
+        outcome = run_on_ha_loop(command_coalescer.submit(
+            (entity_id, "cover.set_cover_position"),
+            lambda: client.call_service("cover", "set_cover_position", {"entity_id": entity_id, "position": position})
+        ))
+        return jsonify({
+            'success': True,
+            'result': outcome['result'],
+            'coalesced': outcome['coalesced'],
+            'superseded': outcome['superseded']
+        })
         
-        async def call_service_async():
-            try:
-                await ha_client.connect()
-                return await ha_client.call_service("cover", "set_cover_position", {"entity_id": entity_id, "position": position})
-            finally:
-                await ha_client.disconnect()  # Ensure we disconnect properly
+    except Exception as e:
+        logger.error(f"Error setting cover position: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route("/api/services/batch", methods=['POST'])
+def call_services_batch():
+    try:
+        data = request.json or {}
+        calls = data.get('calls')
         
-        result = asyncio.run(call_service_async())
-        return jsonify({'success': True, 'result': result})
+        if not isinstance(calls, list) or not calls:
+            return jsonify({'error': 'Missing calls parameter'}), 400
+        
+        for index, call in enumerate(calls):
+            if not isinstance(call, dict) or not call.get('domain') or not call.get('service'):
+                return jsonify({'error': f'Call {index} needs a domain and a service'}), 400
+        
+        config = get_configuration()
+        if not config:
+            return jsonify({'error': 'Home Assistant not configured'}), 400
+        
+        client = get_ha_client(config)
+        started = time.perf_counter()
+        results = run_on_ha_loop(client.call_services(calls))
+        
+        return jsonify({
+            'success': all(result['success'] for result in results),
+            'results': results,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
         
     except Exception as e:
-        logger.error(f"Error setting cover position: {str(e)}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        logger.error(f"Error running batch service calls: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+if __name__ == "__main__":
+    # Check each required environment variable individually
+    env_vars = {
+        'WEATHER_API_KEY': {
+            'prompt': "\nYou'll need a Weather API key from weatherapi.com\nEnter your Weather API key: ",
+            'validate': lambda key: http_client.get(f"http://api.weatherapi.com/v1/current.json?key={key}&q=London").status_code == 200
+        },
+        'LOCATION': {
+            'prompt': "\nEnter your location (city name or coordinates): ",
+            'validate': lambda x: bool(x.strip())
+        }
+    }
+
+    # Read existing .env file if it exists
+    env_values = {}
+    if os.path.exists('.env'):
+        with open('.env', 'r') as f:
+            for line in f:
+                if '=' in line:
+                    key, value = line.strip().split('=', 1)
+                    env_values[key] = value
+
+    env_updated = False
+    print("\n=== Project Friday Environment Setup ===")
+
+    # Check each variable and prompt if missing or invalid
+    for var_name, config in env_vars.items():
+        current_value = os.getenv(var_name) or env_values.get(var_name)
+        
+        # Skip if value exists and is valid
+        if current_value and config['validate'](current_value):
+            env_values[var_name] = current_value
+            continue
+
+        # Prompt for missing or invalid value
+        while True:
+            value = input(config['prompt']).strip()
+            try:
+                if config['validate'](value):
+                    env_values[var_name] = value
+                    env_updated = True
+                    break
+                print(f"Invalid {var_name}. Please try again.")
+            except:
+                print(f"Error validating {var_name}. Please try again.")
+
+    # Update .env file if changes were made
+    if env_updated:
+        with open('.env', 'w') as f:
+            for key, value in env_values.items():
+                f.write(f'{key}={value}\n')
+        print("\nEnvironment configuration saved successfully!")
+        # Reload environment variables
+        load_dotenv(override=True)
+    
+    
+    # Only setup Spotify if not already configured
+    if not is_spotify_configured():
+        spotify_configured = setup_spotify()
+    
+    # Initialize Spotify client at startup
+    initialize_spotify_client()
+    with app.app_context():
+        db.create_all()
+        # Bring databases created before migrations existed up to date
+        upgrade_database()
+    websocket_server.start(host='0.0.0.0', port=8165, debug=True)
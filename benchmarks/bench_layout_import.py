@@ -0,0 +1,97 @@
+"""Time layout import against rebuilding through the setup routes.
+
+Generates a layout of entities spread over rooms, then measures, on a
+temporary SQLite database:
+
+- setup: /api/setup/rooms + /api/setup/entities, which delete and
+  re-insert everything on every run
+- import (empty): /api/setup/layout into an empty database
+- import (same): re-importing the identical layout, a no-op diff
+- import (5% changed): renames, moves and reorders a slice of entities
+
+    python -m benchmarks.bench_layout_import [entities] [rooms]
+"""
+import random
+import sys
+import time
+
+from benchmarks.bench_setup_entities import StatementCounter, app, db
+from app import Room, Entity, entity_rooms
+from modules.layout_io import LAYOUT_FORMAT, LAYOUT_VERSION
+
+def build_layout(count, room_count, seed=42):
+    rng = random.Random(seed)
+    domains = ('light', 'sensor', 'climate', 'cover', 'media_player')
+    entities = [[f'{domains[index % len(domains)]}.entity_{index}', f'Entity {index}', domains[index % len(domains)]]
+                for index in range(count)]
+    members = [[] for _ in range(room_count)]
+    for entity_id, _, _ in entities:
+        for room in rng.sample(range(room_count), rng.randint(1, 2)):
+            members[room].append([entity_id, len(members[room])])
+    rooms = [[f'Room {index}', index, members[index]] for index in range(room_count)]
+    return {'format': LAYOUT_FORMAT, 'version': LAYOUT_VERSION, 'entities': entities, 'rooms': rooms}
+
+def change_layout(layout, fraction=0.05, seed=7):
+    rng = random.Random(seed)
+    entities = [list(entry) for entry in layout['entities']]
+    rooms = [[name, order, [list(member) for member in members]] for name, order, members in layout['rooms']]
+    for entry in rng.sample(entities, int(len(entities) * fraction)):
+        entry[1] += ' (renamed)'
+    for _, _, members in rooms:
+        for member in rng.sample(members, int(len(members) * fraction)):
+            member[1] += 1000
+    return {**layout, 'entities': entities, 'rooms': rooms}
+
+def clear():
+    db.session.execute(db.delete(entity_rooms))
+    Entity.query.delete()
+    Room.query.delete()
+    db.session.commit()
+
+def measure(counter, action):
+    counter.count = 0
+    started = time.perf_counter()
+    response = action()
+    assert response.status_code == 200, response.json
+    return time.perf_counter() - started, counter.count, response.json
+
+def main(count=5000, room_count=50):
+    client = app.test_client()
+    layout = build_layout(count, room_count)
+    results = []
+    with app.app_context():
+        db.create_all()
+        counter = StatementCounter(db.engine)
+        clear()
+
+        def setup_routes():
+            client.post('/api/setup/rooms', json={'rooms': [name for name, _, _ in layout['rooms']]})
+            room_ids = {room.name: room.id for room in Room.query}
+            rooms_by_entity = {}
+            for name, _, members in layout['rooms']:
+                for entity_id, _ in members:
+                    rooms_by_entity.setdefault(entity_id, []).append(room_ids[name])
+            return client.post('/api/setup/entities', json={'entities': [
+                {'entity_id': entity_id, 'name': name, 'domain': domain, 'rooms': rooms_by_entity.get(entity_id, [])}
+                for entity_id, name, domain in layout['entities']
+            ]})
+
+        results.append(('setup routes', measure(counter, setup_routes)))
+        clear()
+        results.append(('import (empty)', measure(counter, lambda: client.post('/api/setup/layout', json=layout))))
+        results.append(('import (same)', measure(counter, lambda: client.post('/api/setup/layout', json=layout))))
+        changed = change_layout(layout)
+        results.append(('import (5% changed)', measure(counter, lambda: client.post('/api/setup/layout', json=changed))))
+
+        exported = client.get('/api/setup/layout')
+        assert exported.json['entities'] == sorted(changed['entities'])
+
+    print(f"{count} entities across {room_count} rooms, {len(exported.data) / 1024:.0f} KiB exported")
+    print(f"{'run':<20} {'time ms':>9} {'statements':>11}  changes")
+    for name, (elapsed, statements, body) in results:
+        changes = body.get('changes')
+        summary = ', '.join(f'{key}={value}' for key, value in changes.items() if value) if changes else '-'
+        print(f"{name:<20} {elapsed * 1000:>9.1f} {statements:>11}  {summary}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,39 @@
+"""Measure proxied image variants against the original.
+
+Generates a noisy photo-like JPEG (album art from streaming services is
+typically 640-1600 px) and, for a few display widths and formats, reports
+the encoded size, the reduction against the original and the time
+transform_image takes, which is what the first request for a variant pays.
+
+    python -m benchmarks.bench_media_transform [source size] [quality]
+"""
+from io import BytesIO
+import sys
+import time
+
+from PIL import Image
+
+from modules.media_transform import transform_image
+
+def build_source(size):
+    base = Image.effect_mandelbrot((size, size), (-2, -1.5, 1, 1.5), 100)
+    image = Image.merge('RGB', (base, Image.effect_noise((size, size), 40), base.rotate(90)))
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=92)
+    return output.getvalue()
+
+def main(size=1600, quality=80, rounds=5):
+    source = build_source(size)
+    print(f"source {size}x{size} JPEG, {len(source) / 1024:.0f} KiB, quality {quality}")
+    print(f"{'variant':<16} {'KiB':>8} {'smaller':>8} {'ms':>8}")
+    for width in (100, 300, 600):
+        for output_format in ('jpeg', 'webp'):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                body, _ = transform_image(source, width, None, output_format, quality)
+            elapsed = (time.perf_counter() - started) / rounds
+            print(f"{f'w={width} {output_format}':<16} {len(body) / 1024:>8.1f} "
+                  f"{len(source) / len(body):>7.0f}x {elapsed * 1000:>8.1f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,57 @@
+"""Check that the entity listing endpoints load rooms in a fixed number of queries.
+
+Seeds a temporary SQLite database with a growing number of entities, each
+linked to a couple of rooms, and counts the SQL statements and time taken
+by /api/entities/tracked and /api/media_players. Exits non-zero if the
+statement count changes with the number of entities.
+
+    python -m benchmarks.bench_relationship_loading [entities ...]
+"""
+import sys
+import time
+
+from benchmarks.bench_setup_entities import StatementCounter, build_payload, app, db
+from app import Configuration, Room
+
+ENDPOINTS = ('/api/entities/tracked', '/api/media_players')
+
+def seed(client, count, room_ids):
+    response = client.post('/api/setup/entities', json={'entities': build_payload(count, room_ids)})
+    assert response.status_code == 200, response.json
+
+def main(*counts):
+    counts = counts or (10, 100, 1000, 5000)
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        if not Configuration.query.first():
+            db.session.add(Configuration(ha_url='http://ha.local:8123', ws_url='ws://ha.local:8123/api/websocket',
+                                         access_token='bench', is_configured=True))
+        db.session.add_all(Room(name=f'Room {index}', order=index) for index in range(12))
+        db.session.commit()
+        room_ids = [room_id for (room_id,) in db.session.query(Room.id)]
+        counter = StatementCounter(db.engine)
+
+    statements = {endpoint: set() for endpoint in ENDPOINTS}
+    print(f"{'endpoint':<24} {'entities':>9} {'time ms':>9} {'statements':>11}")
+    for count in counts:
+        seed(client, count, room_ids)
+        for endpoint in ENDPOINTS:
+            # Warm up first: the first request also fills in-process caches
+            # (the configuration), which would count against the first size
+            client.get(endpoint)
+            counter.count = 0
+            started = time.perf_counter()
+            response = client.get(endpoint)
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 200, response.json
+            statements[endpoint].add(counter.count)
+            print(f"{endpoint:<24} {count:>9} {elapsed * 1000:>9.1f} {counter.count:>11}")
+
+    growing = [endpoint for endpoint, seen in statements.items() if len(seen) > 1]
+    if growing:
+        print(f"Statement count grows with entities for: {', '.join(growing)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,106 @@
+"""Time the reorder endpoints against the previous per-row implementations.
+
+Seeds a temporary SQLite database with rooms and a room full of devices
+(some of them not yet linked to it), then replays drag-and-drop reorders
+with the old row-by-row code and with the set-based routes, reporting the
+average time and SQL statements per drop.
+
+    python -m benchmarks.bench_reorder [devices] [rooms] [drops]
+"""
+import random
+import sys
+import time
+
+from benchmarks.bench_setup_entities import StatementCounter, app, db
+from app import Room, Entity, entity_rooms
+
+def legacy_reorder_rooms(room_orders):
+    """The previous implementation: one Room lookup per room."""
+    for room_id, new_order in room_orders:
+        room = db.session.get(Room, int(room_id))
+        if room:
+            room.order = new_order
+    db.session.commit()
+
+def legacy_reorder_room_entities(room_id, entity_ids):
+    """The previous implementation: lookup, existence check and write per entity."""
+    Room.query.get_or_404(room_id)
+    for index, entity_id in enumerate(entity_ids):
+        entity = Entity.query.filter_by(entity_id=entity_id).first()
+        if entity:
+            exists = db.session.execute(db.select(entity_rooms).where(
+                entity_rooms.c.room_id == room_id,
+                entity_rooms.c.entity_id == entity.id
+            )).first() is not None
+            if exists:
+                db.session.execute(db.update(entity_rooms).where(
+                    entity_rooms.c.room_id == room_id,
+                    entity_rooms.c.entity_id == entity.id
+                ).values(order=index))
+            else:
+                db.session.execute(db.insert(entity_rooms).values(
+                    room_id=room_id, entity_id=entity.id, order=index))
+    db.session.commit()
+
+def seed(device_count, room_count):
+    db.session.execute(db.delete(entity_rooms))
+    Entity.query.delete()
+    Room.query.delete()
+    rooms = [Room(name=f'Room {index}', order=index) for index in range(room_count)]
+    db.session.add_all(rooms)
+    db.session.flush()
+    entities = [Entity(entity_id=f'light.device_{index}', name=f'Device {index}', domain='light')
+                for index in range(device_count)]
+    db.session.add_all(entities)
+    db.session.flush()
+    # Leave a quarter of the devices unlinked so the insert path runs too
+    db.session.execute(db.insert(entity_rooms), [
+        {'entity_id': entity.id, 'room_id': rooms[0].id, 'order': index}
+        for index, entity in enumerate(entities) if index % 4
+    ])
+    db.session.commit()
+    return [room.id for room in rooms], [entity.entity_id for entity in entities]
+
+def measure(counter, drops, action):
+    counter.count = 0
+    started = time.perf_counter()
+    for _ in range(drops):
+        action()
+    return (time.perf_counter() - started) / drops, counter.count / drops
+
+def main(device_count=40, room_count=12, drops=50):
+    rng = random.Random(42)
+    client = app.test_client()
+    results = []
+    with app.app_context():
+        db.create_all()
+        counter = StatementCounter(db.engine)
+
+        room_ids, entity_ids = seed(device_count, room_count)
+        room_id = room_ids[0]
+
+        def shuffled_rooms():
+            return [[str(room), index] for index, room in enumerate(rng.sample(room_ids, len(room_ids)))]
+
+        def shuffled_entities():
+            return rng.sample(entity_ids, len(entity_ids))
+
+        results.append(('reorder_rooms', 'row-by-row',
+                        measure(counter, drops, lambda: legacy_reorder_rooms(shuffled_rooms()))))
+        results.append(('reorder_rooms', 'set-based', measure(counter, drops, lambda: client.post(
+            '/api/rooms/reorder', json={'roomOrders': shuffled_rooms()}))))
+
+        results.append(('reorder_room_entities', 'row-by-row', measure(
+            counter, drops, lambda: legacy_reorder_room_entities(room_id, shuffled_entities()))))
+        room_ids, _ = seed(device_count, room_count)
+        room_id = room_ids[0]
+        results.append(('reorder_room_entities', 'set-based', measure(counter, drops, lambda: client.post(
+            f'/api/rooms/{room_id}/entities/reorder', json={'entityIds': shuffled_entities()}))))
+
+    print(f"{device_count} devices, {room_count} rooms, {drops} drops")
+    print(f"{'endpoint':<22} {'approach':>10} {'ms/drop':>9} {'statements':>11}")
+    for endpoint, approach, (elapsed, statements) in results:
+        print(f"{endpoint:<22} {approach:>10} {elapsed * 1000:>9.2f} {statements:>11.1f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,89 @@
+"""Time /api/setup/entities against the previous row-by-row import.
+
+Seeds a temporary SQLite database with rooms, then imports the same
+entity payload with the old per-entity ORM loop and with the bulk route,
+reporting wall time and SQL statement counts.
+
+    python -m benchmarks.bench_setup_entities [entities] [rooms]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+_workdir = tempfile.mkdtemp(prefix='friday-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+
+from sqlalchemy import event
+
+from app import app, db, Room, Entity
+
+def build_payload(count, room_ids, seed=42):
+    rng = random.Random(seed)
+    domains = ('light', 'sensor', 'climate', 'cover', 'media_player')
+    return [{
+        'entity_id': f'{domains[index % len(domains)]}.entity_{index}',
+        'name': f'Entity {index}',
+        'domain': domains[index % len(domains)],
+        'rooms': rng.sample(room_ids, rng.randint(1, 2))
+    } for index in range(count)]
+
+def legacy_setup_entities(entities):
+    """The previous implementation: one ORM object and one Room lookup at a time."""
+    Entity.query.delete()
+    db.session.execute(db.text('DELETE FROM entity_rooms'))
+    db.session.commit()
+    for entity_data in entities:
+        entity = Entity(
+            entity_id=entity_data['entity_id'],
+            name=entity_data['name'],
+            domain=entity_data['domain']
+        )
+        db.session.add(entity)
+        for room_id in entity_data['rooms']:
+            room = db.session.get(Room, room_id)
+            if room:
+                entity.rooms.append(room)
+    db.session.commit()
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def main(count=5000, room_count=12):
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        Room.query.delete()
+        db.session.add_all(Room(name=f'Room {index}', order=index) for index in range(room_count))
+        db.session.commit()
+        room_ids = [room_id for (room_id,) in db.session.query(Room.id)]
+        payload = build_payload(count, room_ids)
+        counter = StatementCounter(db.engine)
+
+        counter.count = 0
+        started = time.perf_counter()
+        legacy_setup_entities(payload)
+        legacy = (time.perf_counter() - started, counter.count)
+        db.session.remove()
+
+    with app.app_context():
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.post('/api/setup/entities', json={'entities': payload})
+        bulk = (time.perf_counter() - started, counter.count)
+        assert response.status_code == 200, response.json
+        assert Entity.query.count() == count
+
+    print(f"{count} entities across {room_count} rooms")
+    print(f"{'approach':>10} {'time ms':>10} {'statements':>11}")
+    for name, (elapsed, statements) in (('row-by-row', legacy), ('bulk', bulk)):
+        print(f"{name:>10} {elapsed * 1000:>10.1f} {statements:>11}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,124 @@
+"""Compare SQLite throughput under concurrent readers and writers.
+
+Builds the app's schema in two temporary database files, one with
+SQLAlchemy's defaults (rollback journal, default pool) and one with the
+profile from modules/sqlite_profile.py, then runs the same mix for each:
+reader threads loading a room's devices like /api/rooms/<id>/devices
+and writer threads saving a new device order like the reorder route.
+
+    python -m benchmarks.bench_sqlite_concurrency [readers] [writers] [seconds]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, select, update, insert, case
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from modules import sqlite_profile
+from modules.models import db, Room, Entity, entity_rooms
+
+DEVICES = 40
+ROOMS = 12
+
+def build_engine(path, profile):
+    uri = f"sqlite:///{path}"
+    if not profile:
+        return create_engine(uri)
+    config = {name: getattr(Config, name) for name in dir(Config) if name.startswith('SQLITE_')}
+    engine = create_engine(uri, **sqlite_profile.engine_options(config))
+    sqlite_profile.install_pragmas(engine, config)
+    return engine
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Room), [{'name': f'Room {index}', 'order': index} for index in range(ROOMS)])
+        connection.execute(insert(Entity), [
+            {'entity_id': f'light.device_{index}', 'name': f'Device {index}', 'domain': 'light'}
+            for index in range(DEVICES * ROOMS)
+        ])
+        connection.execute(insert(entity_rooms), [
+            {'entity_id': index + 1, 'room_id': index // DEVICES + 1, 'order': index % DEVICES}
+            for index in range(DEVICES * ROOMS)
+        ])
+
+def read_room(engine, rng):
+    room_id = rng.randint(1, ROOMS)
+    with engine.connect() as connection:
+        connection.execute(
+            select(Entity, entity_rooms.c.order)
+            .join(entity_rooms)
+            .where(entity_rooms.c.room_id == room_id)
+            .order_by(entity_rooms.c.order)
+        ).all()
+
+def save_order(engine, rng):
+    room_id = rng.randint(1, ROOMS)
+    first = (room_id - 1) * DEVICES + 1
+    ids = rng.sample(range(first, first + DEVICES), DEVICES)
+    with engine.begin() as connection:
+        connection.execute(
+            update(entity_rooms)
+            .where(entity_rooms.c.room_id == room_id, entity_rooms.c.entity_id.in_(ids))
+            .values(order=case({entity_id: index for index, entity_id in enumerate(ids)},
+                               value=entity_rooms.c.entity_id))
+        )
+
+def run(engine, readers, writers, seconds):
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    latencies = {'reads': [], 'writes': []}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(kind, operation, seed_value):
+        rng = random.Random(seed_value)
+        done, locked, timings = 0, 0, []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(engine, rng)
+                done += 1
+                timings.append(time.perf_counter() - started)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+        with lock:
+            counts[kind] += done
+            counts['locked'] += locked
+            latencies[kind].extend(timings)
+
+    threads = [threading.Thread(target=worker, args=('reads', read_room, index)) for index in range(readers)]
+    threads += [threading.Thread(target=worker, args=('writes', save_order, 1000 + index)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts, latencies
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main(readers=8, writers=2, seconds=5):
+    workdir = tempfile.mkdtemp(prefix='friday-bench-')
+    print(f"{readers} readers, {writers} writers, {seconds}s per profile")
+    print(f"{'profile':>8} {'reads/s':>9} {'writes/s':>9} {'locked':>7} {'read p99 ms':>12} {'write p99 ms':>13}")
+    for name, profile in (('default', False), ('tuned', True)):
+        engine = build_engine(os.path.join(workdir, f'{name}.db'), profile)
+        seed(engine)
+        counts, latencies = run(engine, readers, writers, seconds)
+        engine.dispose()
+        print(f"{name:>8} {counts['reads'] / seconds:>9.0f} {counts['writes'] / seconds:>9.0f} "
+              f"{counts['locked']:>7} {percentile(latencies['reads'], 0.99) * 1000:>12.1f} "
+              f"{percentile(latencies['writes'], 0.99) * 1000:>13.1f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,83 @@
+"""Compare full json.loads against the streaming get_states parser.
+
+Builds synthetic get_states result messages and reports parse time and
+peak Python memory for both approaches.
+
+    python -m benchmarks.bench_state_parser [counts...]
+"""
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from modules.state_parser import SUPPORTED_DOMAINS, parse_entity_summaries
+
+ALL_DOMAINS = SUPPORTED_DOMAINS + ('switch', 'binary_sensor', 'automation', 'media_player',
+                                   'device_tracker', 'update', 'number', 'select')
+
+def build_message(count, seed=42):
+    rng = random.Random(seed)
+    states = []
+    for index in range(count):
+        domain = rng.choice(ALL_DOMAINS)
+        timestamp = '2025-01-01T00:00:00.000000+00:00'
+        states.append({
+            'entity_id': f'{domain}.entity_{index}',
+            'state': str(rng.random()),
+            'attributes': {
+                'friendly_name': f'Entity {index}',
+                'unit_of_measurement': 'W',
+                'device_class': 'power',
+                'state_class': 'measurement',
+                'icon': 'mdi:flash',
+                'options': [f'option_{n}' for n in range(rng.randint(0, 12))],
+                'extra': {'values': [rng.random() for _ in range(rng.randint(0, 8))]}
+            },
+            'last_changed': timestamp,
+            'last_reported': timestamp,
+            'last_updated': timestamp,
+            'context': {'id': f'01J{index:020d}', 'parent_id': None, 'user_id': None}
+        })
+    return json.dumps({'id': 7, 'type': 'result', 'success': True, 'result': states},
+                      separators=(',', ':'))
+
+def legacy_parse(raw_message):
+    """The previous get_entities path: decode everything, then filter."""
+    response = json.loads(raw_message)
+    formatted = []
+    for entity in response.get('result', []):
+        domain = entity['entity_id'].split('.')[0]
+        if domain in SUPPORTED_DOMAINS:
+            formatted.append({
+                'entity_id': entity['entity_id'],
+                'name': entity.get('attributes', {}).get('friendly_name', entity['entity_id']),
+                'domain': domain
+            })
+    return sorted(formatted, key=lambda x: (x['domain'], x['name']))
+
+def measure(parse, raw_message, repeat=3):
+    best = min(_timed(parse, raw_message) for _ in range(repeat))
+    tracemalloc.start()
+    parse(raw_message)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def _timed(parse, raw_message):
+    started = time.perf_counter()
+    parse(raw_message)
+    return time.perf_counter() - started
+
+def main(counts):
+    print(f"{'entities':>9} {'payload':>9} {'approach':>10} {'time ms':>9} {'peak MiB':>9}")
+    for count in counts:
+        raw_message = build_message(count)
+        assert legacy_parse(raw_message) == parse_entity_summaries(raw_message)
+        for name, parse in (('json.loads', legacy_parse), ('streaming', parse_entity_summaries)):
+            elapsed, peak = measure(parse, raw_message)
+            print(f"{count:>9} {len(raw_message) / 2**20:>8.1f}M {name:>10} "
+                  f"{elapsed * 1000:>9.1f} {peak / 2**20:>9.1f}")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
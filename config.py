@@ -4,3 +4,48 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///smart_home.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite profile, applied to every connection when the database is SQLite.
+    # WAL lets dashboards keep reading while settings saves a layout
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    # NORMAL is crash-safe under WAL and skips an fsync per commit
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    # Milliseconds a connection waits for a lock before 'database is locked'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)
+    # Page cache per connection; negative values are KiB (-16000 is ~16 MB)
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -16000)
+    # Connection pool sized for the threaded server (one thread per request)
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE') or 10)
+    SQLITE_MAX_OVERFLOW = int(os.environ.get('SQLITE_MAX_OVERFLOW') or 20)
+    SQLITE_POOL_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT') or 30)
+    # Seconds a request handler waits on the Home Assistant event loop
+    HA_REQUEST_TIMEOUT = float(os.environ.get('HA_REQUEST_TIMEOUT') or 15)
+    # Window in seconds for collapsing repeated slider commands (0 disables)
+    COMMAND_COALESCE_WINDOW = float(os.environ.get('COMMAND_COALESCE_WINDOW') or 0.25)
+    # Outbound HTTP (weather, Home Assistant media): timeouts in seconds,
+    # retries with backoff for GETs, and keep-alive connections kept per host
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT') or 3.05)
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT') or 10)
+    HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES') or 2)
+    HTTP_RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF') or 0.3)
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE') or 10)
+    # Seconds a cached weather forecast is served before it is refreshed
+    WEATHER_CACHE_TTL = float(os.environ.get('WEATHER_CACHE_TTL') or 600)
+    # Seconds past the TTL it is still served instantly while refreshing in the background
+    WEATHER_CACHE_MAX_STALE = float(os.environ.get('WEATHER_CACHE_MAX_STALE') or 21600)
+    # Proxied media (album art): the cache directory (defaults to
+    # instance/media_cache), byte budgets for the memory and disk tiers, the
+    # largest single image kept, and the seconds an image is reused before
+    # Home Assistant is asked whether it changed, unless it sends its own max-age
+    MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR')
+    MEDIA_CACHE_MEMORY_BYTES = int(os.environ.get('MEDIA_CACHE_MEMORY_BYTES') or 32 * 1024 * 1024)
+    MEDIA_CACHE_DISK_BYTES = int(os.environ.get('MEDIA_CACHE_DISK_BYTES') or 256 * 1024 * 1024)
+    MEDIA_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_ENTRY_BYTES') or 5 * 1024 * 1024)
+    MEDIA_CACHE_TTL = float(os.environ.get('MEDIA_CACHE_TTL') or 300)
+    # Resized and re-encoded variants (?w=&h=&format=): encoder quality for
+    # JPEG and WebP, the largest width or height accepted, and worker threads
+    MEDIA_TRANSFORM_QUALITY = int(os.environ.get('MEDIA_TRANSFORM_QUALITY') or 80)
+    MEDIA_TRANSFORM_MAX_DIMENSION = int(os.environ.get('MEDIA_TRANSFORM_MAX_DIMENSION') or 2048)
+    MEDIA_TRANSFORM_WORKERS = int(os.environ.get('MEDIA_TRANSFORM_WORKERS') or 2)
+    # Seconds /api/dashboard/bootstrap waits for its sections; slower ones
+    # (an unreachable Spotify or weather API) come back null as 'timeout'
+    BOOTSTRAP_TIMEOUT = float(os.environ.get('BOOTSTRAP_TIMEOUT') or 3)
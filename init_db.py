@@ -1,6 +1,10 @@
+from flask_migrate import stamp
 from app import app, db
 
 with app.app_context():
     db.drop_all()  # This ensures we start fresh
     db.create_all()
+    # Fresh tables already match the models; mark every migration as applied,
+    # replacing any revision left in alembic_version by drop_all
+    stamp(purge=True)
     print("Database tables created successfully!")
@@ -0,0 +1,81 @@
+"""add entity and room order indexes
+
+Revision ID: 3f2a9c1d7e41
+Revises:
+Create Date: 2026-10-18 09:45:00.000000
+
+Databases created before migrations existed (db.create_all) have the
+tables but none of these indexes, while fresh ones get them from the
+models, so every index is only created if it is missing. Duplicate
+entity_id rows would block the unique index; they are merged into the
+oldest row first, keeping each room link once.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_entity_entity_id', 'entity', ['entity_id'], True),
+    ('ix_entity_domain', 'entity', ['domain'], False),
+    ('ix_entity_rooms_room_id_order', 'entity_rooms', ['room_id', 'order'], False),
+)
+
+
+def _existing_indexes(bind, table):
+    return {index['name'] for index in sa.inspect(bind).get_indexes(table)}
+
+
+def _merge_duplicate_entities(bind):
+    duplicates = bind.execute(sa.text(
+        'SELECT entity_id, MIN(id) FROM entity GROUP BY entity_id HAVING COUNT(*) > 1'
+    )).fetchall()
+
+    for entity_id, keep_id in duplicates:
+        drop_ids = [row[0] for row in bind.execute(
+            sa.text('SELECT id FROM entity WHERE entity_id = :entity_id AND id != :keep_id'),
+            {'entity_id': entity_id, 'keep_id': keep_id}
+        )]
+        linked_rooms = {row[0] for row in bind.execute(
+            sa.text('SELECT room_id FROM entity_rooms WHERE entity_id = :keep_id'),
+            {'keep_id': keep_id}
+        )}
+        for drop_id in drop_ids:
+            links = bind.execute(
+                sa.text('SELECT room_id, "order" FROM entity_rooms WHERE entity_id = :drop_id'),
+                {'drop_id': drop_id}
+            ).fetchall()
+            for room_id, order in links:
+                if room_id not in linked_rooms:
+                    bind.execute(
+                        sa.text('INSERT INTO entity_rooms (entity_id, room_id, "order") '
+                                'VALUES (:keep_id, :room_id, :order)'),
+                        {'keep_id': keep_id, 'room_id': room_id, 'order': order}
+                    )
+                    linked_rooms.add(room_id)
+            bind.execute(sa.text('DELETE FROM entity_rooms WHERE entity_id = :drop_id'), {'drop_id': drop_id})
+            bind.execute(sa.text('DELETE FROM entity WHERE id = :drop_id'), {'drop_id': drop_id})
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'ix_entity_entity_id' not in _existing_indexes(bind, 'entity'):
+        _merge_duplicate_entities(bind)
+
+    for name, table, columns, unique in INDEXES:
+        if name not in _existing_indexes(bind, table):
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for name, table, _, _ in reversed(INDEXES):
+        if name in _existing_indexes(bind, table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _KeyState:
+    __slots__ = ('queued', 'coalesced')
+
+    def __init__(self):
+        # (command, future) waiting for the current window to close
+        self.queued = None
+        # Commands dropped in favour of a later one since the last send
+        self.coalesced = 0
+
+class CommandCoalescer:
+    """Collapses bursts of the same command into the latest value.
+
+    The first command for a key runs straight away and opens a window.
+    Commands for that key arriving inside the window replace each other,
+    and only the latest is sent when the window closes, so dragging a
+    slider sends at most one command per window instead of dozens.
+    Superseded callers return immediately with superseded set.
+
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, window=0.25):
+        self.window = window
+        self._keys = {}
+        self._tasks = set()
+        self.stats = {'received': 0, 'executed': 0, 'coalesced': 0}
+
+    async def submit(self, key, command):
+        """Run command() (a coroutine factory) unless a newer one replaces it.
+
+        Returns a dict with the command's result, how many earlier commands
+        were folded into it, and whether it was itself superseded.
+        """
+        self.stats['received'] += 1
+        if self.window <= 0:
+            return await self._execute(command, 0)
+
+        state = self._keys.get(key)
+        if state is None:
+            self._keys[key] = _KeyState()
+            try:
+                return await self._execute(command, 0)
+            finally:
+                self._schedule_window_close(key)
+
+        future = asyncio.get_running_loop().create_future()
+        if state.queued:
+            _, superseded = state.queued
+            state.coalesced += 1
+            self.stats['coalesced'] += 1
+            if not superseded.done():
+                superseded.set_result({'result': None, 'coalesced': 0, 'superseded': True})
+        state.queued = (command, future)
+        return await future
+
+    async def _execute(self, command, coalesced):
+        self.stats['executed'] += 1
+        result = await command()
+        return {'result': result, 'coalesced': coalesced, 'superseded': False}
+
+    def _schedule_window_close(self, key):
+        asyncio.get_running_loop().call_later(self.window, self._start_close_window, key)
+
+    def _start_close_window(self, key):
+        task = asyncio.ensure_future(self._close_window(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _close_window(self, key):
+        state = self._keys.get(key)
+        if state is None or state.queued is None:
+            # Nothing arrived during the window; the key goes idle again
+            self._keys.pop(key, None)
+            return
+
+        (command, future), state.queued = state.queued, None
+        coalesced, state.coalesced = state.coalesced, 0
+        try:
+            outcome = await self._execute(command, coalesced)
+            if not future.done():
+                future.set_result(outcome)
+        except Exception as e:
+            logger.error(f"Coalesced command for {key} failed: {str(e)}")
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._schedule_window_close(key)
@@ -0,0 +1,53 @@
+from collections import namedtuple
+import threading
+
+# Read-only copy of the Configuration row; safe to share between threads
+# because, unlike an ORM instance, it is not tied to any session
+ConfigurationSnapshot = namedtuple('ConfigurationSnapshot', [
+    'id', 'ha_url', 'ws_url', 'access_token', 'is_nabu_casa', 'is_configured'
+])
+
+def snapshot_configuration(config):
+    if config is None:
+        return None
+    return ConfigurationSnapshot(
+        id=config.id,
+        ha_url=config.ha_url,
+        ws_url=config.ws_url,
+        access_token=config.access_token,
+        is_nabu_casa=config.is_nabu_casa,
+        is_configured=config.is_configured
+    )
+
+_MISSING = object()
+
+class ConfigurationCache:
+    """Keeps the configuration in memory so requests don't re-read it.
+
+    The loader runs once, on first use after start-up or invalidate(), and
+    its result (including None when nothing is configured yet) is served
+    until invalidate() is called. Anything that writes the Configuration
+    table must call invalidate() after committing.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value = _MISSING
+
+    def get(self):
+        value = self._value
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            # Loading under the lock means an invalidate() that follows a
+            # commit waits for any in-flight load, so a stale row read before
+            # the commit can never outlive the invalidation
+            if self._value is _MISSING:
+                self._value = self._loader()
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = _MISSING
@@ -0,0 +1,75 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundLoop:
+    """A single asyncio event loop running in its own daemon thread.
+
+    Flask handlers are synchronous, so anything async (the Home Assistant
+    connection, its state cache and subscriptions) lives on this loop and
+    handlers hand coroutines over with run() or submit().
+    """
+
+    def __init__(self, name='background-loop', default_timeout=15):
+        self.name = name
+        self.default_timeout = default_timeout
+        self.loop = None
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent future."""
+        if not self.is_running:
+            coro.close()
+            raise RuntimeError(f"Event loop '{self.name}' is not running")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block until it finishes.
+
+        The coroutine is cancelled if it does not finish within the timeout.
+        """
+        timeout = timeout or self.default_timeout
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Operation timed out after {timeout} seconds")
+
+    def stop(self, timeout=5):
+        """Cancel outstanding tasks and stop the loop thread."""
+        if not self.is_running:
+            return
+
+        async def _shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(_shutdown(), self.loop).result(timeout)
+        except Exception as e:
+            logger.error(f"Error shutting down event loop: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
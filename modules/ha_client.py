@@ -5,18 +5,34 @@ from urllib.parse import urlparse
 import socket
 import logging
 import ssl
-import subprocess
-import platform
+import time
+from modules.state_parser import (
+    SUPPORTED_DOMAINS, apply_entities_event, parse_entity_summaries, peek_message_id, summarize_entity
+)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Hosts that passed a reachability probe recently: (host, port, tls) -> checked_at
+_reachable_hosts = {}
+
+def _default_port(scheme):
+    """The port websockets connects to when the URL doesn't name one."""
+    return 443 if scheme in ('wss', 'https') else 80
+
 class HomeAssistantClient:
+    # get_states on a large install easily exceeds the 1 MiB websockets default
+    MAX_MESSAGE_SIZE = 32 * 1024 * 1024
+    DEFAULT_TIMEOUT = 10
+    # How long a successful reachability probe is trusted, in seconds
+    REACHABILITY_TTL = 30
+    PROBE_TIMEOUT = 5
+
     def __init__(self, ws_url=None, access_token=None, is_nabu_casa=False):
         if ws_url:
             parsed_url = urlparse(ws_url)
             self.host = parsed_url.hostname
-            self.port = parsed_url.port or 8123
+            self.port = parsed_url.port or _default_port(parsed_url.scheme)
             self.is_nabu_casa = is_nabu_casa
             self.ws_url = f"{ws_url}/api/websocket"
             logger.debug(f"Initialized HomeAssistantClient with URL: {self.ws_url}")
@@ -25,56 +41,71 @@ class HomeAssistantClient:
         self.access_token = access_token
         self.connection = None
         self.message_id = 1
+        self._pending = {}
+        self._raw_handlers = {}
+        self._subscriptions = {}
+        self._reader_task = None
+        self._reconnect_task = None
+        self._connect_lock = None
+        self._closed = False
+        # Live entity states, kept current by a subscribe_entities subscription
+        self.states = {}
+        self._tracking_states = False
+        self._state_listeners = []
 
-    def _ping_host(self):
-        """Test if host responds to ping"""
-        try:
-            param = '-n' if platform.system().lower() == 'windows' else '-c'
-            command = ['ping', param, '1', self.host]
-            logger.debug(f"Attempting to ping {self.host}")
-            subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
-            return True
-        except subprocess.TimeoutExpired:
-            logger.error(f"Ping timeout for {self.host}")
-            return False
-        except Exception as e:
-            logger.error(f"Ping failed: {str(e)}")
-            return False
+    async def _check_host_connectivity(self):
+        """Test basic connectivity to the host.
 
-    def _check_host_connectivity(self):
-        """Test basic connectivity to the host"""
+        Opens a TCP (and, for wss://, TLS) connection to the port the
+        WebSocket will use, without blocking the event loop. Successful
+        probes are remembered for REACHABILITY_TTL seconds so repeated
+        connection tests don't pay for the round trip again.
+        """
         if self.is_nabu_casa:
             return True, None
 
-        try:
-            # First try ping
-            if not self._ping_host():
-                error_msg = (f"Cannot ping {self.host}. Please verify:\n"
-                           f"1. The IP address/hostname is correct\n"
-                           f"2. Home Assistant is running\n"
-                           f"3. You are on the same network (for local connections)\n"
-                           f"4. No firewall is blocking the connection")
-                return False, error_msg
-
-            logger.debug(f"Attempting TCP connection to {self.host}:{self.port}")
-            sock = socket.create_connection((self.host, self.port), timeout=5)
-            sock.close()
-            logger.debug("TCP connection successful")
+        use_tls = self.ws_url.startswith('wss://')
+        key = (self.host, self.port, use_tls)
+        checked_at = _reachable_hosts.get(key)
+        if checked_at and time.monotonic() - checked_at < self.REACHABILITY_TTL:
+            logger.debug(f"{self.host}:{self.port} was reachable recently, skipping probe")
             return True, None
 
+        error_msg = await self._probe_host(use_tls)
+        if error_msg:
+            _reachable_hosts.pop(key, None)
+            return False, error_msg
+
+        _reachable_hosts[key] = time.monotonic()
+        return True, None
+
+    async def _probe_host(self, use_tls):
+        """Open and close a connection to the host; returns an error message or None."""
+        try:
+            logger.debug(f"Probing {self.host}:{self.port}{' with TLS' if use_tls else ''}")
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    self.host, self.port, ssl=self._create_ssl_context() if use_tls else None
+                ),
+                timeout=self.PROBE_TIMEOUT
+            )
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            logger.debug("Connection probe successful")
+            return None
+
         except socket.gaierror:
             error_msg = f"Could not resolve hostname {self.host}. Please check the URL."
-            logger.error(error_msg)
-            return False, error_msg
-        except socket.timeout:
+        except asyncio.TimeoutError:
             error_msg = f"Connection to {self.host}:{self.port} timed out."
-            logger.error(error_msg)
-            return False, error_msg
         except ConnectionRefusedError:
             error_msg = f"Connection refused on {self.host}:{self.port}. Please verify Home Assistant is running."
-            logger.error(error_msg)
-            return False, error_msg
-        except socket.error as e:
+        except ssl.SSLError as e:
+            error_msg = f"TLS handshake with {self.host}:{self.port} failed: {str(e)}"
+        except OSError as e:
             error_msg = (f"Network error connecting to {self.host}:{self.port}\n"
                         f"Error: {str(e)}\n"
                         f"Please verify:\n"
@@ -82,30 +113,22 @@ class HomeAssistantClient:
                         f"2. Home Assistant is running\n"
                         f"3. You are on the same network (for local connections)\n"
                         f"4. No firewall is blocking the connection")
-            logger.error(f"TCP connection failed: {str(e)}")
-            return False, error_msg
+        logger.error(error_msg)
+        return error_msg
 
     async def _test_connection_async(self):
         try:
             # Check basic connectivity first
-            can_connect, error_msg = self._check_host_connectivity()
+            can_connect, error_msg = await self._check_host_connectivity()
             if not can_connect:
                 return False, error_msg
 
             logger.debug(f"Attempting WebSocket connection to {self.ws_url}")
             
-            # Create SSL context if needed
-            ssl_context = None
-            if self.is_nabu_casa or self.ws_url.startswith('wss://'):
-                ssl_context = ssl.create_default_context()
-                if not self.is_nabu_casa:
-                    ssl_context.check_hostname = False
-                    ssl_context.verify_mode = ssl.CERT_NONE
-
             # Connect to WebSocket
             async with websockets.connect(
                 self.ws_url,
-                ssl=ssl_context,
+                ssl=self._create_ssl_context(),
                 close_timeout=5,
                 ping_interval=None  # Disable ping to speed up test
             ) as websocket:
@@ -147,34 +170,39 @@ class HomeAssistantClient:
             logger.error(f"Connection test failed: {str(e)}")
             return False, str(e)
 
-    def test_connection(self):
+    async def test_connection(self):
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            return loop.run_until_complete(self._test_connection_async())
+            return await self._test_connection_async()
         except Exception as e:
             error_message = str(e)
             logger.error(f"Connection test failed: {error_message}")
             return False, error_message
 
-    async def connect(self):
-        """Connect to the Home Assistant WebSocket."""
-        if self.connection:
-            await self.disconnect()
-        
-        # Create SSL context if needed
+    def _create_ssl_context(self):
+        """Build the SSL context used for wss:// connections, if any."""
         ssl_context = None
         if self.is_nabu_casa or self.ws_url.startswith('wss://'):
             ssl_context = ssl.create_default_context()
             if not self.is_nabu_casa:
                 ssl_context.check_hostname = False
                 ssl_context.verify_mode = ssl.CERT_NONE
+        return ssl_context
+
+    async def connect(self):
+        """Connect to the Home Assistant WebSocket."""
+        if self._closed:
+            # close() is final: a replaced client must not come back with
+            # its old URL and token
+            raise ConnectionError("Home Assistant client has been closed")
+        if self.connection:
+            await self.disconnect()
         
         # Connect to WebSocket
         self.connection = await websockets.connect(
             self.ws_url,
-            ssl=ssl_context,
-            close_timeout=5
+            ssl=self._create_ssl_context(),
+            close_timeout=5,
+            max_size=self.MAX_MESSAGE_SIZE
         )
         
         # Wait for auth_required message
@@ -195,98 +223,328 @@ class HomeAssistantClient:
             await self.disconnect()
             raise Exception("Authentication failed")
 
-    async def send_command(self, domain, service, entity_id):
+        # From here on a single reader owns the socket and routes every
+        # message to whoever is waiting for it
+        self._subscriptions = {}
+        self._reader_task = asyncio.create_task(self._read_messages(self.connection))
+        logger.debug(f"Connected to {self.ws_url}")
+
+    async def ensure_connected(self):
+        """Open the shared connection unless it is already up."""
+        if self._closed:
+            raise ConnectionError("Home Assistant client has been closed")
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if not self.connection:
+                await self.connect()
+                if self._tracking_states:
+                    await self._sync_states()
+
+    @property
+    def is_connected(self):
+        return self.connection is not None
+
+    def _next_message_id(self):
+        message_id = self.message_id
+        self.message_id += 1
+        return message_id
+
+    async def send_message(self, message, timeout=None):
+        """Send a command over the shared connection and wait for its result.
+
+        Every command gets a fresh id so any number of callers can have
+        requests in flight on the same socket at once.
+        """
+        await self.ensure_connected()
+        return await self._request(message, timeout)
+
+    async def _request(self, message, timeout=None, message_id=None, raw_handler=None):
+        """Send a command and wait for its result.
+
+        A raw_handler receives the undecoded result text and returns the
+        parsed result, or None to fall back to regular JSON decoding.
+        """
+        timeout = timeout or self.DEFAULT_TIMEOUT
+        message_id = message_id or self._next_message_id()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        if raw_handler:
+            self._raw_handlers[message_id] = raw_handler
+        try:
+            await self.connection.send(json.dumps({**message, "id": message_id}))
+            response = await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+            self._raw_handlers.pop(message_id, None)
+
+        if not response.get("success", True):
+            error = response.get("error", {})
+            error_msg = error.get("message", "Unknown error")
+            logger.error(f"Command {message['type']} failed: {error_msg}")
+            raise Exception(f"Failed to run {message['type']}: {error_msg}")
+
+        return response.get("result")
+
+    async def _read_messages(self, connection):
+        """Dispatch incoming messages until the connection goes away."""
+        try:
+            async for raw_message in connection:
+                if self._raw_handlers and self._dispatch_raw_message(raw_message):
+                    continue
+                self._dispatch_message(json.loads(raw_message))
+        except websockets.ConnectionClosed as e:
+            logger.warning(f"Home Assistant connection closed: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error reading from Home Assistant: {str(e)}")
+        finally:
+            lost = self.connection is connection
+            if lost:
+                self.connection = None
+            self._fail_pending(ConnectionError("Connection to Home Assistant lost"))
+            # Subscribers rely on the cache staying live, so don't wait for
+            # the next request to notice the connection is gone
+            if lost and self._tracking_states and not self._closed:
+                self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 1
+        while not self.connection and not self._closed:
+            await asyncio.sleep(delay)
+            if self._closed:
+                break
+            try:
+                await self.ensure_connected()
+                logger.info("Reconnected to Home Assistant")
+            except Exception as e:
+                logger.warning(f"Reconnecting to Home Assistant failed: {str(e)}")
+                delay = min(delay * 2, 30)
+
+    def _dispatch_message(self, message):
+        if message.get("type") == "result":
+            future = self._pending.get(message.get("id"))
+            if future and not future.done():
+                future.set_result(message)
+        elif message.get("type") == "event":
+            callback = self._subscriptions.get(message.get("id"))
+            if callback:
+                try:
+                    callback(message["event"])
+                except Exception as e:
+                    logger.error(f"Error handling event: {str(e)}")
+
+    def _dispatch_raw_message(self, raw_message):
+        """Hand a result to its raw handler, skipping the full json.loads."""
+        message_id = peek_message_id(raw_message)
+        handler = self._raw_handlers.get(message_id)
+        if not handler:
+            return False
+
+        future = self._pending.get(message_id)
+        try:
+            result = handler(raw_message)
+        except Exception as e:
+            if future and not future.done():
+                future.set_exception(e)
+            return True
+        if result is None:
+            return False
+
+        if future and not future.done():
+            future.set_result({"id": message_id, "type": "result", "success": True, "result": result})
+        return True
+
+    def _fail_pending(self, error):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def subscribe_events(self, callback, event_type=None):
+        """Subscribe to Home Assistant events; returns the subscription id."""
+        await self.ensure_connected()
+        return await self._subscribe({"type": "subscribe_events", "event_type": event_type}, callback)
+
+    async def _subscribe(self, message, callback):
+        if not message.get("event_type"):
+            message.pop("event_type", None)
+        message_id = self._next_message_id()
+        # Register before sending so events that race the result aren't lost
+        self._subscriptions[message_id] = callback
+        try:
+            await self._request(message, message_id=message_id)
+        except Exception:
+            self._subscriptions.pop(message_id, None)
+            raise
+        return message_id
+
+    async def unsubscribe(self, subscription_id):
+        if self._subscriptions.pop(subscription_id, None) and self.connection:
+            await self._request({"type": "unsubscribe_events", "subscription": subscription_id})
+
+    async def subscribe_entities(self, callback, entity_ids=None):
+        """Follow entity states using Home Assistant's compressed protocol.
+
+        Instead of full old/new state objects per state_changed event, HA
+        sends the initial states once and then only the keys that changed.
+        Full states are rebuilt locally and passed to
+        callback(entity_id, new_state, old_state); new_state is None when an
+        entity is removed. entity_ids limits the subscription to those
+        entities (all entities when omitted). Returns the subscription id.
+        """
+        await self.ensure_connected()
+        states = {}
+
+        def handle_event(event):
+            for entity_id, new_state, old_state in apply_entities_event(states, event):
+                callback(entity_id, new_state, old_state)
+
+        message = {"type": "subscribe_entities"}
+        if entity_ids is not None:
+            message["entity_ids"] = list(entity_ids)
+        return await self._subscribe(message, handle_event)
+
+    async def track_states(self):
+        """Start keeping self.states in sync with Home Assistant.
+
+        The first subscribe_entities event carries every state and later ones
+        only carry diffs, so after this reads are dict lookups instead of full
+        state dumps. Safe to call repeatedly; the cache is resynced after
+        reconnects.
+        """
+        await self.ensure_connected()
+        if self._tracking_states:
+            return
+        async with self._connect_lock:
+            if not self._tracking_states:
+                await self._sync_states()
+                self._tracking_states = True
+
+    def add_state_listener(self, listener):
+        """Call listener(event) for every subscribe_entities event the cache applies.
+
+        Events arrive in the compressed form (see subscribe_entities) after
+        self.states has been updated; a resync after reconnecting delivers
+        every state again as additions.
+        """
+        if listener not in self._state_listeners:
+            self._state_listeners.append(listener)
+
+    def remove_state_listener(self, listener):
+        if listener in self._state_listeners:
+            self._state_listeners.remove(listener)
+
+    async def _sync_states(self):
+        """Subscribe to all entities and wait for the initial states."""
+        states = {}
+        initial_states = asyncio.get_running_loop().create_future()
+
+        def handle_event(event):
+            apply_entities_event(states, event)
+            if not initial_states.done():
+                initial_states.set_result(None)
+            for listener in list(self._state_listeners):
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.error(f"Error in state listener: {str(e)}")
+
+        try:
+            await self._subscribe({"type": "subscribe_entities"}, handle_event)
+            await asyncio.wait_for(initial_states, self.DEFAULT_TIMEOUT)
+        except Exception:
+            await self.disconnect()
+            raise
+
+        self.states = states
+        logger.debug(f"State cache synced with {len(states)} entities")
+
+    async def call_service(self, domain, service, service_data=None, target=None):
+        """Call a Home Assistant service and return its result."""
         message = {
             "type": "call_service",
             "domain": domain,
-            "service": service,
-            "target": {
-                "entity_id": entity_id
-            }
+            "service": service
         }
-        await self.connection.send(json.dumps(message))
+        if service_data:
+            message["service_data"] = service_data
+        if target:
+            message["target"] = target
+        return await self.send_message(message)
+
+    async def call_services(self, calls):
+        """Run several service calls concurrently over the shared connection.
+
+        Each call is a dict with domain, service and optional target/data.
+        Results come back in the same order, each with its own timing, and
+        a failing call does not affect the others.
+        """
+        await self.ensure_connected()
+
+        async def run_call(call):
+            started = time.perf_counter()
+            try:
+                result = await self.call_service(
+                    call['domain'], call['service'], call.get('data'), call.get('target')
+                )
+                outcome = {'success': True, 'result': result}
+            except Exception as e:
+                outcome = {'success': False, 'error': str(e)}
+            outcome['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            return outcome
+
+        return await asyncio.gather(*(run_call(call) for call in calls))
+
+    async def send_command(self, domain, service, entity_id):
+        return await self.call_service(domain, service, target={"entity_id": entity_id})
 
     async def get_entities(self):
-        if not self.connection:
-            await self.connect()
-        
-        message = {
-            "id": 1,
-            "type": "get_states"
-        }
-        await self.connection.send(json.dumps(message))
-        response = await self.connection.recv()
-        response_data = json.loads(response)
-        
-        if not response_data.get("success", True):
-            error = response_data.get("error", {})
-            error_msg = error.get("message", "Unknown error")
-            logger.error(f"Error getting states: {error_msg}")
-            raise Exception(f"Failed to get states: {error_msg}")
-        
-        entities = response_data.get("result", [])
-        
-        # Define supported domains
-        supported_domains = ['light', 'sensor', 'climate', 'vacuum', 'cover']
-        
-        # Format and filter entities for frontend
-        formatted_entities = []
-        for entity in entities:
-            if 'entity_id' in entity:
-                domain = entity['entity_id'].split('.')[0]
-                if domain in supported_domains:
-                    formatted_entities.append({
-                        'entity_id': entity['entity_id'],
-                        'name': entity.get('attributes', {}).get('friendly_name', entity['entity_id']),
-                        'domain': domain
-                    })
-        
-        # Sort entities by domain and name
-        return sorted(formatted_entities, key=lambda x: (x['domain'], x['name']))
+        """List entities of the supported domains for the setup wizard."""
+        await self.ensure_connected()
+
+        if self._tracking_states:
+            formatted_entities = [
+                summarize_entity(state) for entity_id, state in self.states.items()
+                if entity_id.split('.', 1)[0] in SUPPORTED_DOMAINS
+            ]
+            return sorted(formatted_entities, key=lambda x: (x['domain'], x['name']))
+
+        # Project each entity as it is decoded instead of building the whole
+        # state tree only to throw most of it away
+        return await self._request({"type": "get_states"}, raw_handler=parse_entity_summaries)
 
     async def disconnect(self):
         """Disconnect from the Home Assistant WebSocket."""
-        if self.connection:
+        connection, self.connection = self.connection, None
+        reader_task, self._reader_task = self._reader_task, None
+        if reader_task and reader_task is not asyncio.current_task():
+            reader_task.cancel()
+        if connection:
             try:
-                await self.connection.close()
+                await connection.close()
             except Exception as e:
                 logger.error(f"Error disconnecting: {str(e)}")
-            finally:
-                self.connection = None
+        self._fail_pending(ConnectionError("Disconnected from Home Assistant"))
+
+    async def close(self):
+        """Disconnect for good; the client can't be connected again afterwards."""
+        self._closed = True
+        reconnect_task, self._reconnect_task = self._reconnect_task, None
+        if reconnect_task and reconnect_task is not asyncio.current_task():
+            reconnect_task.cancel()
+        await self.disconnect()
 
     async def get_entity_states(self, entity_ids):
-        """Get states for specific entity IDs."""
-        if not self.connection:
-            await self.connect()
-        
-        message = {
-            "id": 1,
-            "type": "get_states"
-        }
-        await self.connection.send(json.dumps(message))
-        response = await self.connection.recv()
-        response_data = json.loads(response)
-        
-        if not response_data.get("success", True):
-            error = response_data.get("error", {})
-            error_msg = error.get("message", "Unknown error")
-            logger.error(f"Error getting states: {error_msg}")
-            raise Exception(f"Failed to get states: {error_msg}")
-        
-        # Create a dictionary of entity states
-        states = {}
-        for state in response_data.get("result", []):
-            if state['entity_id'] in entity_ids:
-                states[state['entity_id']] = state
-        
-        return states
+        """Get states for specific entity IDs from the live state cache."""
+        await self.track_states()
+        return {entity_id: self.states[entity_id] for entity_id in entity_ids if entity_id in self.states}
 
     async def update_config(self, new_url=None, new_token=None):
         """Update the client configuration with new URL and/or token."""
         if new_url:
             parsed_url = urlparse(new_url)
             self.host = parsed_url.hostname
-            self.port = parsed_url.port or 8123
+            self.port = parsed_url.port or _default_port(parsed_url.scheme)
             self.ws_url = f"{new_url}/api/websocket"
         
         if new_token:
@@ -302,9 +560,6 @@ class HomeAssistantClient:
 
     async def validate_entities(self, entity_ids):
         """Validate that the given entity IDs exist and are accessible."""
-        if not self.connection:
-            await self.connect()
-        
         states = await self.get_entity_states(entity_ids)
         valid_entities = []
         invalid_entities = []
@@ -0,0 +1,144 @@
+from collections import deque
+from urllib.parse import urlsplit
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class _HostStats:
+    __slots__ = ('requests', 'errors', 'total_ms', 'max_ms', 'recent_ms')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        # Latencies of the latest requests, for percentiles
+        self.recent_ms = deque(maxlen=500)
+
+class HttpClient:
+    """Shared outbound HTTP with one pooled, keep-alive session per upstream host.
+
+    Requests to the same host (Home Assistant, weatherapi.com) reuse warm
+    connections instead of opening a new TCP/TLS connection each time.
+    Every call gets connect and read timeouts unless it passes its own, so
+    a hung upstream can't hold a worker forever, and idempotent GETs are
+    retried with exponential backoff on connection failures and 429/5xx
+    gateway responses.
+    """
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.3, pool_size=10):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _new_session(self):
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            status_forcelist=self.RETRY_STATUSES,
+            # A read timeout already cost a full read_timeout; don't multiply it
+            read=0,
+            # Hand the last response back instead of raising, so callers
+            # see the upstream status as before
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def session_for(self, url):
+        host = self._host(url)
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = self._sessions[host] = self._new_session()
+                    self._stats[host] = _HostStats()
+        return session
+
+    def request(self, method, url, **kwargs):
+        """Like requests.request, on the host's pooled session with default timeouts.
+
+        With stream=True the latency recorded is the time to the response
+        headers.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        session = self.session_for(url)
+        stats = self._stats[self._host(url)]
+        started = time.perf_counter()
+        try:
+            return session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                stats.requests += 1
+                stats.total_ms += elapsed_ms
+                stats.max_ms = max(stats.max_ms, elapsed_ms)
+                stats.recent_ms.append(elapsed_ms)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def stats(self):
+        """Per-host request counts, latency and connection pool usage."""
+        report = {}
+        with self._lock:
+            hosts = list(self._stats.items())
+        for host, stats in hosts:
+            with self._lock:
+                recent = sorted(stats.recent_ms)
+                entry = {
+                    'requests': stats.requests,
+                    'errors': stats.errors,
+                    'avg_ms': round(stats.total_ms / stats.requests, 1) if stats.requests else 0,
+                    'p50_ms': round(recent[len(recent) // 2], 1) if recent else 0,
+                    'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 1) if recent else 0,
+                    'max_ms': round(stats.max_ms, 1)
+                }
+            session = self._sessions.get(host)
+            if session:
+                entry['pool'] = self._pool_stats(session)
+            report[host] = entry
+        return report
+
+    def _pool_stats(self, session):
+        # http:// and https:// are mounted on the same adapter
+        adapter = session.get_adapter('https://')
+        stats = {'connections_opened': 0, 'requests_sent': 0, 'idle': 0, 'maxsize': self.pool_size}
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            stats['connections_opened'] += pool.num_connections
+            stats['requests_sent'] += pool.num_requests
+            if pool.pool:
+                # Unused slots in the pool's queue are None placeholders
+                stats['idle'] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return stats
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
@@ -0,0 +1,167 @@
+from modules.models import db, Room, Entity, entity_rooms
+
+LAYOUT_FORMAT = 'friday-layout'
+LAYOUT_VERSION = 1
+
+def export_layout():
+    """Serialise every room, entity and room link into one compact document.
+
+    Rooms are identified by name and entities by their Home Assistant
+    entity_id, so a layout exported from one installation can be imported
+    into another where the database ids differ:
+
+        {"format": "friday-layout", "version": 1,
+         "entities": [[entity_id, name, domain], ...],
+         "rooms": [[name, order, [[entity_id, order], ...]], ...]}
+    """
+    entity_ids = {}
+    entities = []
+    for pk, entity_id, name, domain in db.session.query(
+            Entity.id, Entity.entity_id, Entity.name, Entity.domain).order_by(Entity.entity_id):
+        entity_ids[pk] = entity_id
+        entities.append([entity_id, name, domain])
+
+    links = {}
+    for room_id, entity_pk, order in db.session.query(
+            entity_rooms.c.room_id, entity_rooms.c.entity_id, entity_rooms.c.order
+    ).order_by(entity_rooms.c.room_id, entity_rooms.c.order):
+        if entity_pk in entity_ids:
+            links.setdefault(room_id, []).append([entity_ids[entity_pk], order or 0])
+
+    rooms = [[room.name, room.order or 0, links.get(room.id, [])]
+             for room in Room.query.order_by(Room.order, Room.id)]
+
+    return {'format': LAYOUT_FORMAT, 'version': LAYOUT_VERSION, 'entities': entities, 'rooms': rooms}
+
+def _parse_layout(layout):
+    if not isinstance(layout, dict) or layout.get('format') != LAYOUT_FORMAT:
+        raise ValueError('Not a layout file')
+    if layout.get('version') != LAYOUT_VERSION:
+        raise ValueError(f"Unsupported layout version {layout.get('version')}")
+
+    try:
+        entities = {}
+        for entity_id, name, domain in layout.get('entities', []):
+            entities[entity_id] = (name, domain)
+
+        rooms = []
+        for name, order, members in layout.get('rooms', []):
+            room_links = {}
+            for entity_id, entity_order in members:
+                if entity_id not in entities:
+                    raise ValueError(f"Room {name} lists unknown entity {entity_id}")
+                room_links[entity_id] = entity_order
+            rooms.append((name, order, room_links))
+    except TypeError:
+        raise ValueError('Malformed layout file')
+    return entities, rooms
+
+def import_layout(layout):
+    """Make the database match an exported layout, touching only what differs.
+
+    Entities are matched on entity_id and rooms on name (in order, if a
+    name repeats). Unchanged rows are left alone, so their ids and creation
+    dates survive; everything else is applied with one bulk statement per
+    kind of change. The caller commits. Returns counts of what changed.
+    """
+    entities, rooms = _parse_layout(layout)
+    stats = {key: 0 for key in (
+        'entities_added', 'entities_updated', 'entities_removed', 'entities_unchanged',
+        'rooms_added', 'rooms_updated', 'rooms_removed',
+        'links_added', 'links_updated', 'links_removed'
+    )}
+
+    # Entities
+    existing_entities = {entity_id: (pk, name, domain) for pk, entity_id, name, domain in
+                         db.session.query(Entity.id, Entity.entity_id, Entity.name, Entity.domain)}
+    added = [{'entity_id': entity_id, 'name': name, 'domain': domain}
+             for entity_id, (name, domain) in entities.items() if entity_id not in existing_entities]
+    updated = [{'id': pk, 'name': entities[entity_id][0], 'domain': entities[entity_id][1]}
+               for entity_id, (pk, name, domain) in existing_entities.items()
+               if entity_id in entities and entities[entity_id] != (name, domain)]
+    removed_entities = [pk for entity_id, (pk, _, _) in existing_entities.items() if entity_id not in entities]
+
+    stats['entities_added'] = len(added)
+    stats['entities_updated'] = len(updated)
+    stats['entities_removed'] = len(removed_entities)
+    stats['entities_unchanged'] = len(existing_entities) - len(updated) - len(removed_entities)
+
+    # Rooms, matched by name in order of appearance
+    existing_rooms = {}
+    for pk, name, order in db.session.query(Room.id, Room.name, Room.order).order_by(Room.order, Room.id):
+        existing_rooms.setdefault(name, []).append((pk, order))
+    room_targets = []
+    new_rooms = []
+    room_updates = []
+    for name, order, room_links in rooms:
+        candidates = existing_rooms.get(name)
+        if candidates:
+            pk, current_order = candidates.pop(0)
+            if current_order != order:
+                room_updates.append({'id': pk, 'order': order})
+            room_targets.append((pk, room_links))
+        else:
+            new_rooms.append({'name': name, 'order': order})
+            room_targets.append((None, room_links))
+    removed_rooms = [pk for candidates in existing_rooms.values() for pk, _ in candidates]
+
+    stats['rooms_added'] = len(new_rooms)
+    stats['rooms_updated'] = len(room_updates)
+    stats['rooms_removed'] = len(removed_rooms)
+
+    # Links of removed rows go first, then the rows themselves
+    if removed_entities:
+        db.session.execute(db.delete(entity_rooms).where(entity_rooms.c.entity_id.in_(removed_entities)))
+        db.session.execute(db.delete(Entity).where(Entity.id.in_(removed_entities)))
+    if removed_rooms:
+        db.session.execute(db.delete(entity_rooms).where(entity_rooms.c.room_id.in_(removed_rooms)))
+        db.session.execute(db.delete(Room).where(Room.id.in_(removed_rooms)))
+
+    if added:
+        db.session.execute(db.insert(Entity), added)
+    if updated:
+        db.session.execute(db.update(Entity), updated)
+    if room_updates:
+        db.session.execute(db.update(Room), room_updates)
+
+    new_room_ids = []
+    if new_rooms:
+        new_room_ids = list(db.session.scalars(
+            db.insert(Room).returning(Room.id, sort_by_parameter_order=True), new_rooms
+        ))
+
+    # Links: compare the wanted (entity, room) -> order map with the table
+    entity_pks = dict(db.session.query(Entity.entity_id, Entity.id))
+    new_room_ids = iter(new_room_ids)
+    wanted = {}
+    for pk, room_links in room_targets:
+        room_pk = pk if pk is not None else next(new_room_ids)
+        for entity_id, order in room_links.items():
+            wanted[(entity_pks[entity_id], room_pk)] = order
+
+    existing_links = {(entity_pk, room_pk): order for entity_pk, room_pk, order in db.session.query(
+        entity_rooms.c.entity_id, entity_rooms.c.room_id, entity_rooms.c.order)}
+
+    where_link = db.and_(entity_rooms.c.entity_id == db.bindparam('link_entity_id'),
+                         entity_rooms.c.room_id == db.bindparam('link_room_id'))
+
+    stale = [{'link_entity_id': entity_pk, 'link_room_id': room_pk}
+             for (entity_pk, room_pk) in existing_links if (entity_pk, room_pk) not in wanted]
+    reordered = [{'link_entity_id': entity_pk, 'link_room_id': room_pk, 'link_order': order}
+                 for (entity_pk, room_pk), order in wanted.items()
+                 if (entity_pk, room_pk) in existing_links and existing_links[(entity_pk, room_pk)] != order]
+    new_links = [{'entity_id': entity_pk, 'room_id': room_pk, 'order': order}
+                 for (entity_pk, room_pk), order in wanted.items() if (entity_pk, room_pk) not in existing_links]
+
+    if stale:
+        db.session.execute(db.delete(entity_rooms).where(where_link), stale)
+    if reordered:
+        db.session.execute(
+            db.update(entity_rooms).where(where_link).values(order=db.bindparam('link_order')), reordered)
+    if new_links:
+        db.session.execute(db.insert(entity_rooms), new_links)
+
+    stats['links_added'] = len(new_links)
+    stats['links_updated'] = len(reordered)
+    stats['links_removed'] = len(stale)
+    return stats
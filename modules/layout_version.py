@@ -0,0 +1,25 @@
+import threading
+import uuid
+
+class LayoutVersion:
+    """Counter for changes to rooms, entities and their ordering.
+
+    Every route that writes the layout calls bump() after committing, and
+    the read endpoints use etag() to answer repeat requests with 304 Not
+    Modified instead of rebuilding the same JSON. The tag includes a
+    per-process token, so a counter that restarts at zero can't match a
+    tag a browser cached before the restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boot = uuid.uuid4().hex[:8]
+        self.version = 0
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def etag(self):
+        return f"layout-{self._boot}-{self.version}"
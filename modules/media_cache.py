@@ -0,0 +1,318 @@
+from collections import OrderedDict, namedtuple
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# One cached image. body is None for entries only held on disk; checked_at
+# is wall-clock time so freshness survives a restart
+MediaEntry = namedtuple('MediaEntry', [
+    'content_type', 'etag', 'upstream_etag', 'last_modified', 'max_age', 'checked_at', 'size', 'body'
+])
+
+def is_fresh(entry):
+    return time.time() - entry.checked_at < entry.max_age
+
+def media_etag(body):
+    return hashlib.sha1(body).hexdigest()
+
+def make_entry(body, content_type, upstream_etag=None, last_modified=None, max_age=0, etag=None):
+    return MediaEntry(
+        content_type=content_type,
+        etag=etag or upstream_etag or media_etag(body),
+        upstream_etag=upstream_etag,
+        last_modified=last_modified,
+        max_age=max_age,
+        checked_at=time.time(),
+        size=len(body),
+        body=body
+    )
+
+class MediaCache:
+    """Two-tier LRU cache of proxied images: a small memory tier over a larger disk tier.
+
+    Both tiers are bounded by total bytes and evict least recently used
+    entries first. Every entry is written to disk; the memory tier holds
+    the bodies of the most recently used ones, up to an eighth of its
+    budget each, so one large image can't flush it. A disk hit is promoted
+    back into memory when it fits; larger ones come back without a body,
+    to be streamed with open_body(). The disk index is rebuilt from the
+    directory on start-up, so the cache survives restarts. Entries larger
+    than max_entry_bytes are not cached at all.
+    """
+
+    def __init__(self, directory, memory_bytes, disk_bytes, max_entry_bytes):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.memory_entry_bytes = memory_bytes // 8
+        self._memory = OrderedDict()  # key -> MediaEntry with body
+        self._memory_size = 0
+        self._disk = OrderedDict()  # key -> MediaEntry without body
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + suffix)
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                # Left behind by a write interrupted by a crash
+                self._remove_temp(os.path.join(self.directory, name))
+                continue
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+                key = meta.pop('key')
+                entry = MediaEntry(body=None, **meta)
+                if not os.path.exists(self._path(key, '.body')):
+                    raise ValueError('body missing')
+                entries.append((os.path.getmtime(path), key, entry))
+            except (OSError, ValueError, TypeError, KeyError) as e:
+                logger.error(f"Dropping unreadable media cache entry {name}: {str(e)}")
+                self._remove_files(path[:-len('.json')])
+
+        # Oldest first, so the most recently used end up at the LRU tail
+        for _, key, entry in sorted(entries, key=lambda item: item[0]):
+            self._disk[key] = entry
+            self._disk_size += entry.size
+        self._evict()
+
+    def get(self, key):
+        """The cached entry, or None; body is None when it is only on disk."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._disk.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return entry
+            entry = self._disk.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry.size > self.memory_entry_bytes:
+                self._disk.move_to_end(key)
+                self._stats['disk_hits'] += 1
+
+        if entry.size > self.memory_entry_bytes:
+            self._touch(key)
+            return entry
+
+        try:
+            with open(self._path(key, '.body'), 'rb') as f:
+                body = f.read()
+        except OSError:
+            # Evicted by another thread since the lookup
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        entry = entry._replace(body=body)
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                self._store_in_memory(key, entry)
+            self._stats['disk_hits'] += 1
+        self._touch(key)
+        return entry
+
+    def open_body(self, key):
+        """Open the cached body for streaming; OSError if it has been evicted."""
+        return open(self._path(key, '.body'), 'rb')
+
+    def put(self, key, entry):
+        """Cache entry (from make_entry); entries over max_entry_bytes are skipped."""
+        if entry.size > self.max_entry_bytes:
+            return
+
+        try:
+            self._write(self._path(key, '.body'), entry.body)
+            self._write_meta(key, entry)
+        except OSError as e:
+            logger.error(f"Could not write media cache entry: {str(e)}")
+            return
+
+        with self._lock:
+            previous = self._disk.pop(key, None)
+            if previous is not None:
+                self._disk_size -= previous.size
+            self._disk[key] = entry._replace(body=None)
+            self._disk_size += entry.size
+            self._store_in_memory(key, entry)
+            self._stats['stores'] += 1
+            self._evict()
+
+    def store_stream(self, key, chunks, content_type, upstream_etag=None, last_modified=None, max_age=0):
+        """Pass chunks through unchanged while writing them to the cache.
+
+        Chunks go to a temporary file rather than memory, and the entry is
+        added once the last one has been yielded. If the body grows past
+        max_entry_bytes, the disk fails or the stream is closed early (the
+        client went away), nothing is stored.
+        """
+        body_path = self._path(key, '.body')
+        temp_path = self._temp_path(body_path)
+        digest = hashlib.sha1()
+        size = 0
+        complete = False
+        try:
+            f = open(temp_path, 'wb')
+        except OSError as e:
+            logger.error(f"Could not write media cache entry: {str(e)}")
+            f = None
+
+        try:
+            for chunk in chunks:
+                if f is not None:
+                    size += len(chunk)
+                    written = False
+                    if size <= self.max_entry_bytes:
+                        try:
+                            f.write(chunk)
+                            digest.update(chunk)
+                            written = True
+                        except OSError as e:
+                            logger.error(f"Could not write media cache entry: {str(e)}")
+                    if not written:
+                        f.close()
+                        f = None
+                        self._remove_temp(temp_path)
+                yield chunk
+            complete = True
+        finally:
+            if f is not None:
+                f.close()
+                if complete:
+                    self._commit(key, temp_path, body_path, MediaEntry(
+                        content_type=content_type,
+                        etag=upstream_etag or digest.hexdigest(),
+                        upstream_etag=upstream_etag,
+                        last_modified=last_modified,
+                        max_age=max_age,
+                        checked_at=time.time(),
+                        size=size,
+                        body=None
+                    ))
+                else:
+                    self._remove_temp(temp_path)
+
+    def _commit(self, key, temp_path, body_path, entry):
+        try:
+            os.replace(temp_path, body_path)
+            self._write_meta(key, entry)
+        except OSError as e:
+            logger.error(f"Could not write media cache entry: {str(e)}")
+            self._remove_temp(temp_path)
+            return
+
+        with self._lock:
+            previous = self._disk.pop(key, None)
+            if previous is not None:
+                self._disk_size -= previous.size
+            # The body was never held in memory; the next get() loads it
+            memory_entry = self._memory.pop(key, None)
+            if memory_entry is not None:
+                self._memory_size -= memory_entry.size
+            self._disk[key] = entry
+            self._disk_size += entry.size
+            self._stats['stores'] += 1
+            self._evict()
+
+    def revalidated(self, key, entry, max_age):
+        """Record that upstream confirmed entry is unchanged; returns the updated entry."""
+        entry = entry._replace(max_age=max_age, checked_at=time.time())
+        with self._lock:
+            if key not in self._disk:
+                return entry
+            self._disk[key] = entry._replace(body=None)
+            if key in self._memory:
+                self._memory[key] = entry
+        try:
+            self._write_meta(key, entry)
+        except OSError as e:
+            logger.error(f"Could not update media cache entry: {str(e)}")
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_size,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_size
+            }
+
+    def _store_in_memory(self, key, entry):
+        # Called with the lock held
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= previous.size
+        if entry.size <= self.memory_entry_bytes:
+            self._memory[key] = entry
+            self._memory_size += entry.size
+
+    def _evict(self):
+        # Called with the lock held
+        while self._memory_size > self.memory_bytes:
+            _, entry = self._memory.popitem(last=False)
+            self._memory_size -= entry.size
+        while self._disk_size > self.disk_bytes:
+            key, entry = self._disk.popitem(last=False)
+            self._disk_size -= entry.size
+            self._stats['evictions'] += 1
+            memory_entry = self._memory.pop(key, None)
+            if memory_entry is not None:
+                self._memory_size -= memory_entry.size
+            self._remove_files(self._path(key, ''))
+
+    def _temp_path(self, path):
+        return f'{path}.{threading.get_ident()}.tmp'
+
+    def _remove_temp(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def _write(self, path, data):
+        # Write then rename, so readers never see a half-written file
+        temp_path = self._temp_path(path)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _write_meta(self, key, entry):
+        meta = entry._replace(body=None)._asdict()
+        del meta['body']
+        self._write(self._path(key, '.json'), json.dumps({'key': key, **meta}).encode())
+
+    def _touch(self, key):
+        # The metadata file's mtime orders the LRU after a restart
+        try:
+            os.utime(self._path(key, '.json'))
+        except OSError:
+            pass
+
+    def _remove_files(self, base):
+        for suffix in ('.body', '.json'):
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Could not remove media cache file {base}{suffix}: {str(e)}")
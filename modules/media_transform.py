@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import threading
+
+from PIL import Image, ImageOps
+
+# format parameter -> (Pillow format, content type)
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+    'png': ('PNG', 'image/png')
+}
+
+# Sources in these formats keep them when no format is asked for
+KEPT_FORMATS = {'JPEG': 'jpeg', 'WEBP': 'webp', 'PNG': 'png'}
+
+def parse_transform(args, max_dimension):
+    """(width, height, format) from the w, h and format query parameters.
+
+    Returns None when none of them is given. Missing values are None; a
+    missing format keeps the source's. Raises ValueError for bad values.
+    """
+    if not any(args.get(name) for name in ('w', 'h', 'format')):
+        return None
+
+    size = []
+    for name in ('w', 'h'):
+        value = args.get(name)
+        if not value:
+            size.append(None)
+            continue
+        if not value.isdigit() or not 0 < int(value) <= max_dimension:
+            raise ValueError(f"{name} must be a whole number of pixels between 1 and {max_dimension}")
+        size.append(int(value))
+
+    output_format = args.get('format')
+    if output_format:
+        output_format = output_format.lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(sorted(OUTPUT_FORMATS))}")
+        output_format = 'jpeg' if output_format == 'jpg' else output_format
+    return size[0], size[1], output_format
+
+def transform_key(width, height, output_format):
+    return f"{width or ''}x{height or ''}.{output_format or 'auto'}"
+
+def transform_image(body, width, height, output_format, quality):
+    """Shrink an image to fit width x height and re-encode it; returns (bytes, content type).
+
+    The aspect ratio is kept and images are never enlarged. EXIF rotation
+    is applied first, since the metadata carrying it is dropped.
+    """
+    image = Image.open(BytesIO(body))
+    if output_format is None:
+        output_format = KEPT_FORMATS.get(image.format, 'jpeg')
+    pillow_format, content_type = OUTPUT_FORMATS[output_format]
+
+    image = ImageOps.exif_transpose(image)
+    if width or height:
+        # thumbnail() lets the JPEG decoder scale down while decoding
+        image.thumbnail((width or image.width, height or image.height), Image.Resampling.LANCZOS)
+
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    if pillow_format == 'JPEG' or not has_alpha:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+    elif image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    output = BytesIO()
+    if pillow_format == 'JPEG':
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif pillow_format == 'WEBP':
+        image.save(output, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(output, 'PNG')
+    return output.getvalue(), content_type
+
+class TransformPool:
+    """Runs image jobs on a few worker threads instead of request threads.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so the
+    workers run in parallel with each other and with request handling.
+    A job run under a key that is already running joins it and shares its
+    result, so new album art that every tablet asks for at once is fetched
+    and transformed once.
+    """
+
+    def __init__(self, workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-transform')
+        self._inflight = {}  # key -> Future of the running job
+        self._lock = threading.Lock()
+
+    def run(self, key, job, *args):
+        """Run job(*args) on the pool, or join the running one for key, and wait for its result."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._run, key, job, *args)
+                self._inflight[key] = future
+        return future.result()
+
+    def _run(self, key, job, *args):
+        try:
+            return job(*args)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
@@ -23,13 +23,15 @@ class Room(db.Model):
 entity_rooms = db.Table('entity_rooms',
     db.Column('entity_id', db.Integer, db.ForeignKey('entity.id'), primary_key=True),
     db.Column('room_id', db.Integer, db.ForeignKey('room.id'), primary_key=True),
-    db.Column('order', db.Integer, default=0)  # Add order field here
+    db.Column('order', db.Integer, default=0),  # Add order field here
+    # Room pages list a room's entities in display order
+    db.Index('ix_entity_rooms_room_id_order', 'room_id', 'order')
 )
 
 class Entity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    entity_id = db.Column(db.String(100), nullable=False)
+    entity_id = db.Column(db.String(100), nullable=False, unique=True, index=True)
     name = db.Column(db.String(100), nullable=False)
-    domain = db.Column(db.String(50), nullable=False)
+    domain = db.Column(db.String(50), nullable=False, index=True)
     rooms = db.relationship('Room', secondary=entity_rooms, back_populates='entities')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
@@ -0,0 +1,48 @@
+import json
+import threading
+
+class RoomSnapshots:
+    """Pre-encoded device lists for every room, rebuilt when the layout changes.
+
+    Switching rooms is the most frequent request the tablets make, so
+    instead of querying and serialising on each one, the device lists of
+    all rooms are built in a single pass and kept as JSON bytes. They are
+    tagged with the layout version they were built from; a write bumps the
+    version, and the first read after that rebuilds them all.
+    """
+
+    def __init__(self, layout_version, build_layouts):
+        self.layout_version = layout_version
+        # Returns {room_id: [device, ...]} for every room, in display order
+        self.build_layouts = build_layouts
+        self._lock = threading.Lock()
+        # (layout version, {room_id: (devices, encoded)}), swapped as a whole
+        self._snapshot = (None, {})
+
+    def _current(self):
+        version = self.layout_version.version
+        built_for, rooms = self._snapshot
+        if built_for == version:
+            return rooms
+
+        with self._lock:
+            built_for, rooms = self._snapshot
+            if built_for != version:
+                # The version is read before querying, so a write that lands
+                # during the rebuild leaves these tagged as stale
+                rooms = {
+                    room_id: (devices, json.dumps(devices, separators=(',', ':'), sort_keys=True).encode())
+                    for room_id, devices in self.build_layouts().items()
+                }
+                self._snapshot = (version, rooms)
+            return rooms
+
+    def devices(self, room_id):
+        """The room's devices (shared; don't modify), or None for an unknown room"""
+        snapshot = self._current().get(room_id)
+        return snapshot[0] if snapshot else None
+
+    def encoded(self, room_id):
+        """The room's devices as JSON bytes, or None for an unknown room"""
+        snapshot = self._current().get(room_id)
+        return snapshot[1] if snapshot else None
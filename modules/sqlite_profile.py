@@ -0,0 +1,75 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+import logging
+
+logger = logging.getLogger(__name__)
+
+def is_sqlite(database_uri):
+    return make_url(database_uri).get_backend_name() == 'sqlite'
+
+def is_memory(database_uri):
+    return make_url(database_uri).database in (None, '', ':memory:')
+
+def engine_options(config):
+    """SQLAlchemy engine options for a multi-threaded server on SQLite.
+
+    Flask serves every request (and Socket.IO event) on its own thread, so
+    the pool keeps enough connections for all of them instead of making
+    requests queue for one of the default five. Connections are shared
+    across threads by the pool, which sqlite3 refuses unless
+    check_same_thread is off.
+    """
+    return {
+        'pool_size': config['SQLITE_POOL_SIZE'],
+        'max_overflow': config['SQLITE_MAX_OVERFLOW'],
+        'pool_timeout': config['SQLITE_POOL_TIMEOUT'],
+        'connect_args': {
+            'check_same_thread': False,
+            # sqlite3's own busy wait, in seconds
+            'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000
+        }
+    }
+
+def pragmas(config):
+    return (
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('cache_size', config['SQLITE_CACHE_SIZE'])
+    )
+
+def install_pragmas(engine, config):
+    """Apply the configured pragmas to every new connection of an engine.
+
+    WAL lets readers carry on while a layout is being saved, instead of
+    failing with 'database is locked' whenever a writer needs the lock.
+    """
+    settings = pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in settings:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    logger.debug(f"SQLite pragmas: {', '.join(f'{name}={value}' for name, value in settings)}")
+
+def init_app(app, db):
+    """Apply the SQLite profile; call instead of db.init_app(app).
+
+    Other databases are left to SQLAlchemy's defaults.
+    """
+    if not is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        db.init_app(app)
+        return
+
+    # In-memory databases use a per-thread pool that takes none of these
+    options = {} if is_memory(app.config['SQLALCHEMY_DATABASE_URI']) else engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    with app.app_context():
+        install_pragmas(db.engine, app.config)
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class StaleWhileRevalidateCache:
+    """Caches slow upstream lookups, refreshing expired entries in the background.
+
+    Within ttl seconds of a fetch an entry is served as is. After that it
+    is still served straight away for up to max_stale more seconds while a
+    background refresh runs. Only a missing entry, or one past that window,
+    makes the caller wait on upstream, and if upstream fails then, the last
+    good value is returned rather than the error. Concurrent lookups of the
+    same key share one upstream call.
+    """
+
+    def __init__(self, fetch, ttl, max_stale, name='cache'):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.name = name
+        self._entries = {}  # key -> (value, fetched_at)
+        self._inflight = {}  # key -> Future of the running fetch
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f'{name}-refresh')
+        self.stats = {'fresh': 0, 'stale': 0, 'miss': 0, 'fallback': 0, 'errors': 0}
+
+    def get(self, key):
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """Return (value, state); state is fresh, stale, miss or fallback."""
+        entry = self._entries.get(key)
+        if entry:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                return value, self._count('fresh')
+            if age < self.ttl + self.max_stale:
+                self._refresh(key)
+                return value, self._count('stale')
+
+        try:
+            return self._refresh(key).result(), self._count('miss')
+        except Exception as e:
+            if not entry:
+                raise
+            logger.error(f"{self.name}: refresh of {key} failed, serving last good value: {str(e)}")
+            return entry[0], self._count('fallback')
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _count(self, state):
+        with self._lock:
+            self.stats[state] += 1
+        return state
+
+    def _refresh(self, key):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._load, key)
+                self._inflight[key] = future
+            return future
+
+    def _load(self, key):
+        try:
+            value = self.fetch(key)
+            with self._lock:
+                self._entries[key] = (value, time.monotonic())
+            return value
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"{self.name}: fetching {key} failed: {str(e)}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
@@ -0,0 +1,144 @@
+import json
+import re
+from datetime import datetime, timezone
+
+# Domains offered in the setup wizard's entity picker
+SUPPORTED_DOMAINS = ('light', 'sensor', 'climate', 'vacuum', 'cover')
+
+_MESSAGE_ID = re.compile(r'\s*\{\s*"id"\s*:\s*(\d+)')
+_RESULT_ARRAY = re.compile(r'"result"\s*:\s*\[')
+_SEPARATORS = re.compile(r'[\s,]*')
+
+_decoder = json.JSONDecoder()
+
+def peek_message_id(raw_message):
+    """Read the id of a raw Home Assistant message without decoding it."""
+    match = _MESSAGE_ID.match(raw_message)
+    return int(match.group(1)) if match else None
+
+def summarize_entity(state):
+    """Project a full state object down to what the entity picker needs."""
+    entity_id = state['entity_id']
+    return {
+        'entity_id': entity_id,
+        'name': state.get('attributes', {}).get('friendly_name', entity_id),
+        'domain': entity_id.split('.')[0]
+    }
+
+def iter_states(raw_message):
+    """Yield the state objects of a raw get_states result one at a time.
+
+    Unlike json.loads on the whole message, only one entity (with all of its
+    attributes) is alive at any moment, so callers that keep a projection
+    never hold the full state tree. Returns nothing if the message is not a
+    successful result.
+    """
+    match = _RESULT_ARRAY.search(raw_message)
+    if not match:
+        return
+
+    pos = match.end()
+    while True:
+        pos = _SEPARATORS.match(raw_message, pos).end()
+        if raw_message[pos] == ']':
+            return
+        state, pos = _decoder.raw_decode(raw_message, pos)
+        yield state
+
+def parse_entity_summaries(raw_message, domains=SUPPORTED_DOMAINS):
+    """Parse a raw get_states result into sorted entity summaries.
+
+    Entities outside the requested domains are dropped as soon as they are
+    decoded. Returns None if the message is not a successful result.
+    """
+    if not _RESULT_ARRAY.search(raw_message):
+        return None
+
+    domains = frozenset(domains)
+    summaries = []
+    for state in iter_states(raw_message):
+        entity_id = state.get('entity_id')
+        if entity_id and entity_id.split('.', 1)[0] in domains:
+            summaries.append(summarize_entity(state))
+
+    return sorted(summaries, key=lambda x: (x['domain'], x['name']))
+
+def _format_timestamp(value):
+    return datetime.fromtimestamp(value, timezone.utc).isoformat() if value is not None else None
+
+def expand_compressed_state(entity_id, compressed):
+    """Rebuild a full state object from a subscribe_entities addition.
+
+    Additions use short keys: s (state), a (attributes), c (context id or
+    object), lc (last_changed) and lu (last_updated, omitted when equal to
+    lc), with timestamps as epoch seconds.
+    """
+    context = compressed.get('c')
+    if isinstance(context, str):
+        context = {'id': context, 'parent_id': None, 'user_id': None}
+    last_changed = compressed.get('lc')
+    return {
+        'entity_id': entity_id,
+        'state': compressed.get('s'),
+        'attributes': compressed.get('a', {}),
+        'last_changed': _format_timestamp(last_changed),
+        'last_updated': _format_timestamp(compressed.get('lu', last_changed)),
+        'context': context
+    }
+
+def apply_state_diff(state, diff):
+    """Return a new state with a subscribe_entities change applied.
+
+    Changes carry the keys that were added or updated under "+" and the
+    attribute names that were removed under "-". The old state is left
+    untouched so callers can still compare against it.
+    """
+    new_state = dict(state)
+    to_add = diff.get('+', {})
+    to_remove = diff.get('-', {})
+
+    if 'a' in to_add or 'a' in to_remove:
+        new_state['attributes'] = dict(state.get('attributes', {}))
+
+    if 's' in to_add:
+        new_state['state'] = to_add['s']
+    if 'c' in to_add:
+        context = to_add['c']
+        if isinstance(context, str):
+            new_state['context'] = {**(state.get('context') or {}), 'id': context}
+        else:
+            new_state['context'] = {**(state.get('context') or {}), **context}
+    if 'lc' in to_add:
+        new_state['last_changed'] = new_state['last_updated'] = _format_timestamp(to_add['lc'])
+    elif 'lu' in to_add:
+        new_state['last_updated'] = _format_timestamp(to_add['lu'])
+    if 'a' in to_add:
+        new_state['attributes'].update(to_add['a'])
+    for attribute in to_remove.get('a', []):
+        new_state['attributes'].pop(attribute, None)
+
+    return new_state
+
+def apply_entities_event(states, event):
+    """Apply a subscribe_entities event to a dict of full states in place.
+
+    Returns the resulting changes as (entity_id, new_state, old_state)
+    tuples; new_state is None for removed entities.
+    """
+    changes = []
+    for entity_id, compressed in event.get('a', {}).items():
+        new_state = expand_compressed_state(entity_id, compressed)
+        changes.append((entity_id, new_state, states.get(entity_id)))
+        states[entity_id] = new_state
+    for entity_id, diff in event.get('c', {}).items():
+        old_state = states.get(entity_id)
+        if old_state is None:
+            continue
+        new_state = apply_state_diff(old_state, diff)
+        changes.append((entity_id, new_state, old_state))
+        states[entity_id] = new_state
+    for entity_id in event.get('r', []):
+        old_state = states.pop(entity_id, None)
+        if old_state is not None:
+            changes.append((entity_id, None, old_state))
+    return changes
@@ -1,22 +1,218 @@
+from flask import request
 from flask_socketio import SocketIO, emit
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
 
 class WebSocketServer:
-    def __init__(self, flask_app=None):
+    """Relays Home Assistant to the dashboards over Socket.IO.
+
+    The backend keeps one upstream subscription (the shared client's state
+    cache) and fans every update out to all connected dashboards, instead
+    of each tablet holding its own connection and full subscription on
+    Home Assistant. Dashboards send their service calls through here too,
+    so the access token never has to reach the browser.
+
+    The upstream is looked after by a task on the HA loop, started by the
+    first dashboard: it retries with backoff until Home Assistant can be
+    reached, and whenever the shared client is replaced (settings saved)
+    it moves the relay over to the new one. Each time the relay starts
+    following a client, every dashboard gets the full states again.
+    """
+
+    # Seconds between upstream attempts while Home Assistant is unreachable
+    RETRY_MIN = 1
+    RETRY_MAX = 30
+    # Seconds between checks that the shared client hasn't been replaced,
+    # for changes that don't call wake_upstream()
+    CHECK_INTERVAL = 30
+
+    def __init__(self, flask_app=None, ha_loop=None, client_provider=None, tracked_provider=None):
         self.flask_app = flask_app
-        self.socketio = None
+        self.ha_loop = ha_loop
+        # Returns the current shared HomeAssistantClient (or None if HA isn't configured)
+        self.client_provider = client_provider
+        # Returns the entity ids dashboards display; only these are relayed
+        self.tracked_provider = tracked_provider
+        self.tracked_entity_ids = None
+        # always_connect lets the connect handler emit the initial states
+        self.socketio = SocketIO(async_mode='threading', always_connect=True)
+        self._client = None
+        # The client whose states the dashboards have; None until it syncs
+        self._synced_client = None
+        self._upstream_error = None
+        self._upstream_task = None
+        self._wake = None
+        self._attach_lock = threading.Lock()
+        if flask_app:
+            self.init_app(flask_app)
 
-    def start(self):
-        if not self.flask_app:
-            raise ValueError("Flask app not set")
-        
-        self.socketio = SocketIO(self.flask_app)
-        
+    def init_app(self, flask_app):
+        self.flask_app = flask_app
+        self.socketio.init_app(flask_app)
+        self._register_handlers()
+
+    def _register_handlers(self):
         @self.socketio.on('connect')
         def handle_connect():
-            print('Client connected')
+            logger.debug(f"Dashboard connected: {request.sid}")
+            self.start_upstream()
+            client = self._synced_client
+            if client:
+                self.ha_loop.run(self._send_states(client, request.sid))
+            elif self._upstream_error:
+                # The states follow once the upstream task gets through
+                emit('relay_error', {'error': self._upstream_error})
 
         @self.socketio.on('disconnect')
         def handle_disconnect():
-            print('Client disconnected')
-        
-        self.socketio.run(self.flask_app, host='0.0.0.0', port=8165, debug=True)
+            logger.debug(f"Dashboard disconnected: {request.sid}")
+
+        @self.socketio.on('ha_command')
+        def handle_command(message):
+            return self._run_command(message or {})
+
+    def refresh_tracked_entities(self):
+        """Reload the set of relayed entities; call whenever the Entity table changes."""
+        self.tracked_entity_ids = frozenset(self.tracked_provider())
+        logger.debug(f"Relaying {len(self.tracked_entity_ids)} tracked entities")
+
+    def start_upstream(self):
+        """Start the task that keeps the relay attached to Home Assistant, once."""
+        with self._attach_lock:
+            if self._upstream_task is None:
+                self._upstream_task = self.ha_loop.submit(self._watch_upstream())
+
+    def wake_upstream(self):
+        """Have the upstream task check the shared client now, e.g. after it was replaced."""
+        if self._wake is not None:
+            self.ha_loop.loop.call_soon_threadsafe(self._wake.set)
+
+    def _current_client(self):
+        # Runs in an executor thread: the providers read the database
+        with self.flask_app.app_context():
+            if self.tracked_entity_ids is None:
+                self.refresh_tracked_entities()
+            return self.client_provider()
+
+    async def _watch_upstream(self):
+        self._wake = asyncio.Event()
+        delay = self.RETRY_MIN
+        while True:
+            self._wake.clear()
+            try:
+                client = await asyncio.get_running_loop().run_in_executor(None, self._current_client)
+                if client is None:
+                    self._attach(None)
+                elif client is not self._synced_client:
+                    await client.track_states()
+                    # Attached only now, so the initial sync isn't relayed
+                    # as well; later resyncs are, and nothing runs between
+                    # here and the states being sent
+                    self._attach(client)
+                    self._synced_client = client
+                    self._upstream_error = None
+                    await self._send_states(client)
+                    logger.info("Relay following Home Assistant")
+                # Once synced, the client reconnects and resyncs by itself
+                # and the resync reaches dashboards through _relay_event
+                delay = self.RETRY_MIN
+                timeout = self.CHECK_INTERVAL
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Relay could not reach Home Assistant, retrying in {delay}s: {str(e)}")
+                self._synced_client = None
+                if self._upstream_error is None:
+                    self.socketio.emit('relay_error', {'error': str(e)})
+                self._upstream_error = str(e)
+                timeout = delay
+                delay = min(delay * 2, self.RETRY_MAX)
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _attach(self, client):
+        """Move the relay's state listener onto client."""
+        with self._attach_lock:
+            if client is not self._client:
+                if self._client:
+                    self._client.remove_state_listener(self._relay_event)
+                if client:
+                    client.add_state_listener(self._relay_event)
+                self._client = client
+                self._synced_client = None
+
+    async def _send_states(self, client, sid=None):
+        # Emitted from the HA loop, like relayed events, so a dashboard can
+        # never receive a diff before the states it applies to. Without a
+        # sid every dashboard gets them
+        states = [client.states[entity_id] for entity_id in self.tracked_entity_ids
+                  if entity_id in client.states]
+        self.socketio.emit('states', states, to=sid)
+
+    def _relay_event(self, event):
+        """Forward the tracked part of a compressed state event to every dashboard.
+
+        Runs on the HA loop for every upstream event, so anything the
+        dashboards don't display (power meters and the like) is dropped here
+        with a set lookup instead of being sent to and parsed by each tablet.
+        """
+        tracked = self.tracked_entity_ids
+        if not tracked:
+            return
+
+        relayed = {}
+        for key in ('a', 'c'):
+            entities = {entity_id: value for entity_id, value in event.get(key, {}).items()
+                        if entity_id in tracked}
+            if entities:
+                relayed[key] = entities
+        removed = [entity_id for entity_id in event.get('r', []) if entity_id in tracked]
+        if removed:
+            relayed['r'] = removed
+
+        if relayed:
+            self.socketio.emit('entities', relayed)
+
+    def _run_command(self, message):
+        """Execute a dashboard command and answer in Home Assistant's result format."""
+        message_id = message.get('id')
+        if message.get('type') != 'call_service':
+            return {
+                'id': message_id,
+                'type': 'result',
+                'success': False,
+                'error': {'code': 'not_allowed', 'message': f"Command {message.get('type')} is not relayed"}
+            }
+
+        try:
+            client = self.client_provider()
+            if client is None:
+                raise Exception('Home Assistant not configured')
+            result = self.ha_loop.run(client.call_service(
+                message.get('domain'),
+                message.get('service'),
+                message.get('service_data'),
+                message.get('target')
+            ))
+            return {'id': message_id, 'type': 'result', 'success': True, 'result': result}
+        except Exception as e:
+            logger.error(f"Error relaying command: {str(e)}")
+            return {
+                'id': message_id,
+                'type': 'result',
+                'success': False,
+                'error': {'code': 'relay_error', 'message': str(e)}
+            }
+
+    def start(self, host='0.0.0.0', port=8165, debug=True):
+        if not self.flask_app:
+            raise ValueError("Flask app not set")
+
+        self.socketio.run(self.flask_app, host=host, port=port, debug=debug,
+                          allow_unsafe_werkzeug=True)
@@ -6,6 +6,7 @@ let messageId = 1;
 let pendingUpdates = new Set();
 let messageHandlers = new Map(); // Store message handlers globally
 let selectedMediaPlayer = null; // Store the currently selected media player entity_id
+let mediaPlayers = null; // Media player entities, loaded with the dashboard bootstrap
 
 // Time functions
 function updateTime() {
@@ -41,8 +42,15 @@ function getBlindIcons(device) {
 async function updateWeather() {
     try {
         const forecastResponse = await fetch('/api/weather/forecast');
-        const data = await forecastResponse.json();
-        
+        renderWeather(await forecastResponse.json());
+    } catch (error) {
+        console.error('Error fetching weather:', error);
+        renderWeather({ error: 'Unable to fetch weather data. Please try again later.' });
+    }
+}
+
+function renderWeather(data) {
+    try {
         if (data.error) {
             const errorHTML = `
                 <div class="error">
@@ -129,7 +137,7 @@ const hourlyForecastHTML = `
 document.querySelector('.hourly-forecast').innerHTML = hourlyForecastHTML;
 
     } catch (error) {
-        console.error('Error fetching weather:', error);
+        console.error('Error rendering weather:', error);
         const errorHTML = `
             <div class="error">
                 Unable to fetch weather data. Please try again later.
@@ -141,77 +149,78 @@ document.querySelector('.hourly-forecast').innerHTML = hourlyForecastHTML;
 }
 
 // Home Assistant WebSocket functions
-async function initializeHomeAssistant() {
+async function initializeHomeAssistant(entities) {
     try {
-        const response = await fetch('/api/entities/tracked');
-        const data = await response.json();
+        if (!entities) {
+            const response = await fetch('/api/entities/tracked');
+            entities = (await response.json()).entities;
+        }
 
-        data.entities.forEach(entity => {
+        entities.forEach(entity => {
             trackedEntities[entity.entity_id] = entity;
         });
 
-        await connectToHA(data.ha_config);
+        await connectToRelay();
     } catch (error) {
         console.error('Error initializing HA connection:', error);
     }
 }
 
-function connectToHA(config) {
-    return new Promise((resolve, reject) => {
+// Home Assistant traffic goes through the backend's Socket.IO relay. This
+// wraps the Socket.IO connection in the small WebSocket-like surface the
+// rest of the dashboard uses (send, readyState and 'message' listeners), so
+// commands and their results keep Home Assistant's message format.
+function createRelaySocket() {
+    const socket = io();
+    const messages = new EventTarget();
+
+    return {
+        socket,
+        get readyState() {
+            return socket.connected ? WebSocket.OPEN : WebSocket.CONNECTING;
+        },
+        send(data) {
+            socket.emit('ha_command', JSON.parse(data), (response) => {
+                messages.dispatchEvent(new MessageEvent('message', {
+                    data: JSON.stringify(response)
+                }));
+            });
+        },
+        addEventListener: (type, listener) => messages.addEventListener(type, listener),
+        removeEventListener: (type, listener) => messages.removeEventListener(type, listener),
+        close: () => socket.close()
+    };
+}
+
+function connectToRelay() {
+    return new Promise((resolve) => {
         if (haSocket) {
             haSocket.close();
         }
 
-        const wsUrl = config.ws_url.endsWith('/api/websocket') ? 
-            config.ws_url : 
-            `${config.ws_url}/api/websocket`;
-
-        haSocket = new WebSocket(wsUrl);
+        haSocket = createRelaySocket();
 
-        haSocket.onopen = () => {
-            console.log('Connected to Home Assistant');
-            haSocket.send(JSON.stringify({
-                type: "auth",
-                access_token: config.access_token
-            }));
-        };
+        haSocket.socket.on('connect', () => {
+            console.log('Connected to Home Assistant relay');
+        });
 
-        haSocket.onmessage = (event) => {
-            const message = JSON.parse(event.data);
+        // Sent on every (re)connect, so states are resynced after a drop
+        haSocket.socket.on('states', (states) => {
+            handleInitialStates(states);
+            resolve();
+        });
 
-            if (message.type === "auth_ok") {
-                console.log('Successfully authenticated with Home Assistant');
-                fetchInitialStates().then(() => {
-                    subscribeToStateChanges();
-                    resolve();
-                });
-            } else if (message.type === "auth_invalid") {
-                console.error('Authentication failed:', message);
-                reject(new Error('Authentication failed'));
-            } else if (message.type === "result" && message.success && Array.isArray(message.result)) {
-                handleInitialStates(message.result);
-            } else if (message.type === "event" && message.event.event_type === "state_changed") {
-                handleStateChange(message.event.data);
-            }
-        };
+        haSocket.socket.on('entities', handleEntitiesEvent);
 
-        haSocket.onclose = (event) => {
-            console.log('Disconnected from Home Assistant:', event.code, event.reason);
-            // Implement exponential backoff for reconnection
-            const backoffDelay = Math.min(1000 * Math.pow(2, haSocket.retries || 0), 30000);
-            haSocket.retries = (haSocket.retries || 0) + 1;
-            setTimeout(() => connectToHA(config), backoffDelay);
-        };
+        haSocket.socket.on('relay_error', (data) => {
+            console.error('Relay could not reach Home Assistant:', data.error);
+            resolve();
+        });
 
-        haSocket.onerror = (error) => {
-            console.error('WebSocket error:', error);
-            // Log additional connection details for debugging
-            console.debug('Connection details:', {
-                wsUrl,
-                isNabuCasa: config.is_nabu_casa,
-                readyState: haSocket.readyState
-            });
-        };
+        haSocket.socket.on('disconnect', (reason) => {
+            // Socket.IO reconnects on its own with backoff
+            console.log('Disconnected from Home Assistant relay:', reason);
+        });
     });
 }
 
@@ -219,20 +228,83 @@ function getNextMessageId() {
     return messageId++;
 }
 
-function fetchInitialStates() {
-    return new Promise((resolve) => {
-        haSocket.send(JSON.stringify({
-            id: getNextMessageId(),
-            type: 'get_states'
-        }));
+// State updates arrive in Home Assistant's compressed subscribe_entities
+// format: full states once, after that only the keys that changed
+function formatTimestamp(seconds) {
+    return seconds === undefined ? undefined : new Date(seconds * 1000).toISOString();
+}
 
-        const checkStates = setInterval(() => {
-            if (Object.keys(entityStates).length > 0) {
-                clearInterval(checkStates);
-                resolve();
-            }
-        }, 100);
-    });
+function expandCompressedState(entityId, compressed) {
+    return {
+        entity_id: entityId,
+        state: compressed.s,
+        attributes: compressed.a || {},
+        context: typeof compressed.c === 'string' ?
+            { id: compressed.c, parent_id: null, user_id: null } :
+            compressed.c,
+        last_changed: formatTimestamp(compressed.lc),
+        last_updated: formatTimestamp(compressed.lu ?? compressed.lc)
+    };
+}
+
+function applyStateDiff(state, diff) {
+    const newState = { ...state };
+    const toAdd = diff['+'];
+    const toRemove = diff['-'];
+
+    if (toAdd?.a || toRemove?.a) {
+        newState.attributes = { ...state.attributes };
+    }
+    if (toAdd) {
+        if (toAdd.s !== undefined) {
+            newState.state = toAdd.s;
+        }
+        if (toAdd.c) {
+            newState.context = typeof toAdd.c === 'string' ?
+                { ...state.context, id: toAdd.c } :
+                { ...state.context, ...toAdd.c };
+        }
+        if (toAdd.lc) {
+            newState.last_changed = newState.last_updated = formatTimestamp(toAdd.lc);
+        } else if (toAdd.lu) {
+            newState.last_updated = formatTimestamp(toAdd.lu);
+        }
+        if (toAdd.a) {
+            Object.assign(newState.attributes, toAdd.a);
+        }
+    }
+    if (toRemove?.a) {
+        toRemove.a.forEach(attribute => delete newState.attributes[attribute]);
+    }
+    return newState;
+}
+
+function handleEntitiesEvent(event) {
+    if (event.a) {
+        Object.entries(event.a).forEach(([entityId, compressed]) => {
+            handleStateChange({
+                entity_id: entityId,
+                new_state: expandCompressedState(entityId, compressed),
+                old_state: entityStates[entityId]
+            });
+        });
+    }
+
+    if (event.c) {
+        Object.entries(event.c).forEach(([entityId, diff]) => {
+            const oldState = entityStates[entityId];
+            if (!oldState) return;
+            handleStateChange({
+                entity_id: entityId,
+                new_state: applyStateDiff(oldState, diff),
+                old_state: oldState
+            });
+        });
+    }
+
+    if (event.r) {
+        event.r.forEach(entityId => delete entityStates[entityId]);
+    }
 }
 
 function handleInitialStates(states) {
@@ -282,14 +354,6 @@ function handleInitialStates(states) {
     });
 }
 
-function subscribeToStateChanges() {
-    haSocket.send(JSON.stringify({
-        id: getNextMessageId(),
-        type: "subscribe_events",
-        event_type: "state_changed"
-    }));
-}
-
 function showToast(message, duration = 3000) {
     const toast = document.createElement('div');
     toast.className = 'toast';
@@ -432,16 +496,27 @@ function updateLightCard(entityId, state) {
 // Room and device functions
 async function loadRooms() {
     try {
-        await initializeHomeAssistant();
-
-        const response = await fetch('/api/rooms');
-        const rooms = await response.json();
+        // Tracked entities, rooms, the first room's devices, media players,
+        // weather and Spotify status all arrive in one request
+        const response = await fetch('/api/dashboard/bootstrap');
+        const bootstrap = await response.json();
+        const errors = bootstrap.errors || {};
+        Object.entries(errors).forEach(([section, error]) =>
+            console.error(`Error loading ${section}:`, error));
+
+        renderWeather(bootstrap.weather || { error: errors.weather || 'Unable to fetch weather data. Please try again later.' });
+        mediaPlayers = bootstrap.media_players;
+        if (bootstrap.devices) {
+            roomDevices[bootstrap.devices.room_id] = bootstrap.devices.devices;
+        }
 
-        // Load devices for all rooms first
-        await Promise.all(rooms.map(room => loadRoomDevices(room.id)));
+        await initializeHomeAssistant(bootstrap.tracked || []);
 
-        // Check Spotify status
-        const isSpotifyConnected = await checkSpotifyStatus();
+        if (!bootstrap.rooms) {
+            throw new Error(errors.rooms || 'Rooms unavailable');
+        }
+        const rooms = bootstrap.rooms;
+        const isSpotifyConnected = bootstrap.spotify ? bootstrap.spotify.connected : false;
         
         // Generate room tabs HTML including Spotify if connected
         const roomsHTML = rooms.map(room => `
@@ -467,8 +542,7 @@ async function loadRooms() {
                 if (tab.dataset.roomId === 'spotify') {
                     // Fetch media players before displaying Spotify room
                     try {
-                        const response = await fetch('/api/media_players');
-                        const players = await response.json();
+                        const players = await getMediaPlayers();
                         
                         // If no player is selected, try to find a playing one
                         if (!selectedMediaPlayer) {
@@ -494,6 +568,9 @@ async function loadRooms() {
                     }
                     displaySpotifyRoom();
                 } else {
+                    if (!roomDevices[tab.dataset.roomId]) {
+                        await loadRoomDevices(tab.dataset.roomId);
+                    }
                     displayRoomDevices(tab.dataset.roomId);
                 }
             });
@@ -506,6 +583,11 @@ async function loadRooms() {
         // Hide loader after everything is loaded
         hideLoader();
 
+        // Fetch the other rooms' devices after first paint so switching
+        // tabs stays instant
+        rooms.filter(room => !roomDevices[room.id])
+            .forEach(room => loadRoomDevices(room.id));
+
     } catch (error) {
         console.error('Error loading rooms:', error);
         document.getElementById('roomsContainer').innerHTML = `
@@ -520,8 +602,7 @@ function displayRoom(roomId) {
     if (roomId === 'spotify') {
         // If no player is selected, try to find a playing one
         if (!selectedMediaPlayer) {
-            fetch('/api/media_players')
-                .then(response => response.json())
+            getMediaPlayers()
                 .then(players => {
                     // Find first playing player
                     const playingPlayer = players.find(player => 
@@ -885,6 +966,18 @@ function formatFollowers(count) {
     return count.toString();
 }
 
+async function getMediaPlayers() {
+    if (!Array.isArray(mediaPlayers)) {
+        const response = await fetch('/api/media_players');
+        const players = await response.json();
+        if (!Array.isArray(players)) {
+            throw new Error(players.error || 'Media players unavailable');
+        }
+        mediaPlayers = players;
+    }
+    return mediaPlayers;
+}
+
 async function loadRoomDevices(roomId) {
     try {
         const response = await fetch(`/api/rooms/${roomId}/devices`);
@@ -1829,7 +1922,7 @@ document.addEventListener('DOMContentLoaded', () => {
     updateTime();
     setInterval(updateTime, 60000);
 
-    updateWeather();
+    // The first forecast comes with the dashboard bootstrap in loadRooms()
     setInterval(updateWeather, 900000);
 
     loadRooms();
@@ -1993,7 +2086,7 @@ function updateMediaPlayerCard(entityId, state) {
     
     // Update background with media art if available
     if (state.attributes?.entity_picture) {
-        const artworkUrl = `/api/media_proxy${state.attributes.entity_picture}`;
+        const artworkUrl = mediaArtworkUrl(state.attributes.entity_picture, 300);
         card.style.backgroundImage = `linear-gradient(rgba(0, 0, 0, 0.5), rgba(0, 0, 0, 0.7)), url('${artworkUrl}')`;
         card.style.backgroundSize = 'cover';
         card.style.backgroundPosition = 'center';
@@ -2147,11 +2240,18 @@ const styleSheet = document.createElement("style");
 styleSheet.textContent = mediaPlayerStyles;
 document.head.appendChild(styleSheet);
 
+// Proxied artwork, resized by the server to the width it is shown at
+// (doubled for high-density screens)
+function mediaArtworkUrl(entityPicture, width) {
+    const separator = entityPicture.includes('?') ? '&' : '?';
+    return `/api/media_proxy${entityPicture}${separator}w=${width * 2}`;
+}
+
 // Add this new function to generate media player card HTML
 function getMediaPlayerCard(device, state) {
     const hasMedia = !!state.attributes?.media_title;
     const artworkUrl = state.attributes?.entity_picture ? 
-        `/api/media_proxy${state.attributes.entity_picture}` : '';
+        mediaArtworkUrl(state.attributes.entity_picture, 300) : '';
     
     return `
         <div class="device-card media-player-card ${artworkUrl ? 'has-media' : ''}" 
@@ -2413,7 +2513,7 @@ function updateSpotifyControlBar(state) {
     if (state && state.attributes) {
         // Update track image
         if (state.attributes.entity_picture) {
-            trackImage.src = `/api/media_proxy${state.attributes.entity_picture}`;
+            trackImage.src = mediaArtworkUrl(state.attributes.entity_picture, 50);
         } else {
             trackImage.src = '/static/images/default-spotify.jpg';
         }